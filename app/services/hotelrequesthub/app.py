@@ -17,6 +17,7 @@ from pydantic import ValidationError as PydanticValidationError
 
 from app.services.hotelrequesthub.constants import mongo_obj
 from app.services.hotelrequesthub.hotel_request import HotelRequest
+from app.services.hotelrequesthub.logger import OpensearchLogger
 
 newrelic.agent.initialize()
 
@@ -38,7 +39,8 @@ def handler(event, context):
             "leg_request_id": event["hotel_request"]["leg_request_id"],
             "service": "hotelrequesthub",
         }
-        os.environ["logging_unique_data"] = json.dumps(log_data)
+        # Per thread, the hub shares its process with the xml connectors of the request
+        OpensearchLogger.set_logging_data(log_data)
         # logger.info("Hotel Request hub was started at {}".format(str(lambda_start)))
         # logger.info(f"Input request : {event}")
         event = update_currency_value(event)
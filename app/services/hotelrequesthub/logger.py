@@ -0,0 +1,14 @@
+from opensearchlogger.handlers import logging_unique_id
+
+
+class OpensearchLogger:
+    @staticmethod
+    def set_logging_data(log_data):
+        logging_unique_id.set(
+            {
+                "leg_request_id": log_data.get("leg_request_id") or "",
+                "trip_id": log_data.get("trip_id") or "",
+                "vendor_request_id": log_data.get("vendor_request_id") or "",
+                "service": log_data.get("service") or "hotelrequesthub",
+            }
+        )
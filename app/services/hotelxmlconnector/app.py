@@ -1,4 +1,6 @@
 import concurrent.futures
+import contextvars
+import functools
 import json
 import os
 import traceback
@@ -20,21 +22,35 @@ from helperlayer import (
 from opensearchlogger.logging import logger, opensearch_logger
 from s3connector import save_to_s3
 
-from app.services.hotelxmlconnector.hotel_vendor_request import helper, lat_long_grid_derivation
+from app.services.hotelxmlconnector.hotel_vendor_request import archive, helper, lat_long_grid_derivation, rate_limit, transport
 from app.services.hotelxmlconnector.hotel_vendor_request.connector import HotelVendorRequestHandler
+from app.services.hotelxmlconnector.hotel_vendor_request.dedupe import HotelDedupe
+from app.services.hotelxmlconnector.hotel_vendor_request.density_index import DensityIndex
 from app.services.hotelxmlconnector.hotel_vendor_request.helper import ConnectorStatus
 from app.services.hotelxmlconnector.hotel_vendor_request.hotel import HotelVendorRequestPayload
+from app.services.hotelxmlconnector.hotel_vendor_request.scheduler import VENDOR_IO_LANE, scheduler
+from app.services.hotelxmlconnector.logger import OpensearchLogger
 from app.services.hotelxmlconnector.mongo_util import mongo_obj
 from app.services.hotelxmlconnector import constants
 
 HOTEL_REQUEST_DATE_FORMAT = os.environ["HOTEL_REQUEST_DATE_FORMAT"]
 HOTEL_ERROR_S3_BUCKET = os.environ["HOTEL_ERROR_S3_BUCKET"]
 DEGREE_OF_DEPTH = {"gds": 3, "desiya": 0, "ALLIED_US_PCC": 3}
-MAX_THREAD_WORKER_COUNT = 20
+GRID_PLANNING_MODE = os.getenv("HOTEL_GRID_PLANNING_MODE", "coverage")  # coverage, recursive or adaptive
 
 newrelic_agent = newrelic.agent.register_application()
 tracer = Tracer()
 
+try:
+    # Loaded once per process, the grid depth then follows the historical hotel density of the search area
+    density_index = DensityIndex.load()
+except Exception:
+    density_index = None
+    logger.error(f"Error while loading the hotel density index: {traceback.format_exc()}")
+
+# Optional callable receiving progress records (per location and per connector) as they complete.
+progress_listener = contextvars.ContextVar("progress_listener", default=None)
+
 
 def _process_hotel_request(event, request_context, location):
     """
@@ -73,6 +89,7 @@ def _process_hotel_request(event, request_context, location):
             trip_id=trip_id,
             payload=event,
             sub_vendor_count=request_context["sub_vendor_count"],
+            hotel_dedupe=request_context["hotel_dedupe"],
         )
         result = vendor_request_handler.get_hotels_from_vendor()
 
@@ -93,6 +110,7 @@ def _process_hotel_request(event, request_context, location):
                 "check_in_date": hotel_request["checkin"],
                 "check_out_date": hotel_request["checkout"],
                 "city": hotel_request["location_details"]["city"],
+                **result.get("batch_sizes", {}),
             },
         )
 
@@ -124,6 +142,82 @@ def _process_hotel_request(event, request_context, location):
         return result
 
 
+def _grid_locations(latitude, longitude, radius, depth):
+    if GRID_PLANNING_MODE == "recursive":
+        return lat_long_grid_derivation.get_equivalent_smaller_grids(latitude, longitude, radius, depth)
+    return lat_long_grid_derivation.plan_coverage(latitude, longitude, radius, depth)
+
+
+@functools.lru_cache(maxsize=1024)
+def _grid_coverage(radius, depth, latitude_band):
+    """
+    Coverage of the plans of a radius and depth, measured once per whole degree of latitude. A plan only moves
+    with the longitude and its shape only changes with the latitude, so the ratio of the band holds for every
+    request in it.
+    """
+    latitude = float(latitude_band)
+    locations = _grid_locations(latitude, 0.0, radius, depth)
+    return lat_long_grid_derivation.coverage_ratio(latitude, 0.0, radius, [(lat, lng, int(r)) for lat, lng, r in locations])
+
+
+def _plan_locations(latitude, longitude, radius, vendor):
+    """Vendor search circles of the request, one vendor call each."""
+    if GRID_PLANNING_MODE == "adaptive":
+        # Start with the requested circle, _refine_location splits the cells the vendor capped
+        return [(latitude, longitude, radius)]
+    depth, depth_source = DEGREE_OF_DEPTH[vendor], "vendor"
+    if density_index is not None and depth > 0:
+        try:
+            density_depth = density_index.choose_depth(vendor, latitude, longitude, radius, depth)
+            if density_depth is not None:
+                depth, depth_source = density_depth, "density_index"
+        except Exception:
+            logger.error(f"Error while looking up the hotel density index: {traceback.format_exc()}")
+    locations = _grid_locations(latitude, longitude, radius, depth)
+    coverage = _grid_coverage(radius, depth, max(-89, min(89, round(float(latitude)))))
+    push_newrelic_custom_event(
+        newrelic_agent,
+        constants.GRID_PLAN_EVENT_NAME,
+        {
+            "vendor": vendor,
+            "mode": GRID_PLANNING_MODE,
+            "radius": radius,
+            "depth": depth,
+            "depth_source": depth_source,
+            "calls": len(locations),
+            "coverage": round(coverage, 4),
+        },
+    )
+    return locations
+
+
+def _refine_location(location, level, result, vendor):
+    """
+    Child cells of a completed cell in adaptive mode.
+    Args:
+        location (tuple): latitude, longitude and radius of the cell.
+        level (int): Resolution level of the cell, 0 for the requested circle.
+        result (dict): Result of _process_hotel_request for the cell.
+        vendor (str): Vendor name, DEGREE_OF_DEPTH bounds the levels.
+    Returns:
+        list: (latitude, longitude, radius) of the cells to search next, empty when the cell is not capped.
+    """
+    if GRID_PLANNING_MODE != "adaptive" or not result.get("result_capped") or level >= DEGREE_OF_DEPTH[vendor]:
+        return []
+    return lat_long_grid_derivation.refine_cell(*location)
+
+
+def _emit_progress(record):
+    """Hand a progress record to the listener of the current context, if any."""
+    listener = progress_listener.get()
+    if listener is None:
+        return
+    try:
+        listener(record)
+    except Exception:
+        logger.error(f"Error while emitting connector progress: {traceback.format_exc()}")
+
+
 def _handle_error(error_message, request_context):
     """Handle errors by logging and pushing error data."""
     # connector_status = status
@@ -143,6 +237,7 @@ def handler(event, context: LambdaContext):
     batches = 0
     origin_country = None
     vendor = None
+    hotel_dedupe = HotelDedupe()
 
     try:
         trip_info = event["leg_req_info"]["trip_info"]
@@ -158,7 +253,8 @@ def handler(event, context: LambdaContext):
             "is_farequote_trigger": bool(fre.get("farequote_flag")),
             "service": constants.SERVICE_NAME,
         }
-        os.environ["logging_unique_data"] = json.dumps(log_data)
+        # Per thread, the connectors of a request run concurrently in one process
+        OpensearchLogger.set_logging_data(log_data)
         logger.info(f"{constants.SERVICE_NAME} Event : {event}")
 
         initialise_mongo_connector_helper_layer(mongo_obj)
@@ -170,7 +266,7 @@ def handler(event, context: LambdaContext):
         latitude = hotel_request["location_details"]["lat"]
         longitude = hotel_request["location_details"]["lng"]
         vendor = fre["name"]
-        locations = lat_long_grid_derivation.get_equivalent_smaller_grids(latitude, longitude, radius, DEGREE_OF_DEPTH[vendor])
+        locations = _plan_locations(latitude, longitude, radius, vendor)
         logger.info(f"Original request data: {latitude} {longitude} {radius}" + f"\nNew smaller circles data: {locations}")
         origin_country = hotel_request.get("location_details", {}).get("country_short_name", "")
 
@@ -183,19 +279,26 @@ def handler(event, context: LambdaContext):
             "error_s3_path": f"{trip_id}/{leg_request_id}/{vendor_request_id}.json",
             "log_data": log_data,
             "sub_vendor_count": 1,
+            "hotel_dedupe": hotel_dedupe,
         }
 
         all_statuses = set()
-        # Use ThreadPoolExecutor for concurrent processing
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_THREAD_WORKER_COUNT) as executor:
-            futures = {}
-            for loc in locations:
-                future = executor.submit(_process_hotel_request, event, request_context, loc)
-                futures[future] = loc
+        capped_locations = 0
+        # Locations run on the vendor I/O lane of the process-wide scheduler
+        futures = {}
+
+        def submit_locations(new_locations, level):
+            for new_loc in new_locations:
+                new_future = scheduler.submit(VENDOR_IO_LANE, _process_hotel_request, event, request_context, new_loc)
+                futures[new_future] = (new_loc, level)
                 request_context["sub_vendor_count"] += 1
 
-            for future in concurrent.futures.as_completed(futures):
-                loc = futures[future]
+        submit_locations(locations, 0)
+        # Cells refined in adaptive mode are submitted as their parent completes
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                loc, level = futures.pop(future)
                 try:
                     result = future.result()
                     number_of_pages += result.get("number_of_pages", 0)
@@ -203,9 +306,40 @@ def handler(event, context: LambdaContext):
                     total_hotels += result.get("hotels", 0)
                     logger.info(f"Success for location {loc}: {result}")
                     all_statuses.add(result["connector_status"])
+                    _emit_progress(
+                        {
+                            "type": "location",
+                            "vendor": vendor,
+                            "vendor_request_id": str(vendor_request_id),
+                            "location": list(loc),
+                            "hotels": result.get("hotels", 0),
+                            "number_of_pages": result.get("number_of_pages", 0),
+                            "connector_status": result["connector_status"],
+                            "time_taken": result["time_taken"],
+                        }
+                    )
+                    refined_locations = _refine_location(loc, level, result, vendor)
+                    if refined_locations:
+                        logger.info(f"Refining capped location {loc} into: {refined_locations}")
+                        capped_locations += 1
+                        submit_locations(refined_locations, level + 1)
                 except Exception as exc:
                     logger.error(f"Error for location {loc}: {exc}")
 
+        if GRID_PLANNING_MODE == "adaptive":
+            push_newrelic_custom_event(
+                newrelic_agent,
+                constants.GRID_PLAN_EVENT_NAME,
+                {
+                    "vendor": vendor,
+                    "mode": GRID_PLANNING_MODE,
+                    "radius": radius,
+                    "calls": request_context["sub_vendor_count"] - 1,
+                    "capped_locations": capped_locations,
+                    "coverage": 1,
+                },
+            )
+
         all_statuses = list(all_statuses)
         if ConnectorStatus.SUCCESS in all_statuses:
             connector_status = ConnectorStatus.SUCCESS
@@ -239,6 +373,19 @@ def handler(event, context: LambdaContext):
             connector_end_time,
         )
 
+        _emit_progress(
+            {
+                "type": "connector",
+                "vendor": vendor,
+                "vendor_request_id": str(vendor_request_id),
+                "hotels": total_hotels,
+                "batches": batches,
+                "number_of_pages": number_of_pages,
+                "connector_status": connector_status.value,
+                "time_taken": round(time_delta, 2),
+            }
+        )
+
         push_newrelic_custom_event(
             newrelic_agent,
             "HotelXMLConnector",
@@ -250,3 +397,27 @@ def handler(event, context: LambdaContext):
                 "connector_status": connector_status.value,
             },
         )
+        push_newrelic_custom_event(
+            newrelic_agent,
+            constants.HOTEL_DEDUPE_EVENT_NAME,
+            {"leg_request_id": leg_request_id, "vendor_request_id": vendor_request_id, "vendor": vendor, **hotel_dedupe.metrics()},
+        )
+        for host, connection_stats in transport.connection_stats().items():
+            push_newrelic_custom_event(
+                newrelic_agent,
+                constants.VENDOR_HTTP_CONNECTION_STATS_EVENT_NAME,
+                {"host": host, **connection_stats},
+            )
+        for endpoint, limiter_stats in rate_limit.limiter_stats().items():
+            push_newrelic_custom_event(
+                newrelic_agent,
+                constants.VENDOR_RATE_LIMIT_EVENT_NAME,
+                {"endpoint": endpoint, **limiter_stats},
+            )
+        for lane, lane_stats in scheduler.stats().items():
+            push_newrelic_custom_event(
+                newrelic_agent,
+                constants.SCHEDULER_STATS_EVENT_NAME,
+                {"lane": lane, **lane_stats},
+            )
+        push_newrelic_custom_event(newrelic_agent, constants.ARCHIVE_STATS_EVENT_NAME, archive.get_archiver().stats())
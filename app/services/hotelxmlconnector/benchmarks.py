@@ -0,0 +1,331 @@
+"""
+Benchmarks and offline tools of the hotel vendor request modules, kept out of the runtime package.
+
+Usage:
+    python -m app.services.hotelxmlconnector.benchmarks streaming
+    python -m app.services.hotelxmlconnector.benchmarks chunks
+    python -m app.services.hotelxmlconnector.benchmarks page-index
+    python -m app.services.hotelxmlconnector.benchmarks archive
+    python -m app.services.hotelxmlconnector.benchmarks grid
+    python -m app.services.hotelxmlconnector.benchmarks density-index --vendor gds --output density.sqlite "archive/**/*.xml"
+"""
+import argparse
+import copy
+import glob
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+from lxml import etree
+
+from .hotel_vendor_request import lat_long_grid_derivation
+from .hotel_vendor_request.archive import ARCHIVE_LOCAL_ROOT, Archiver, LocalBackend, decompress
+from .hotel_vendor_request.density_index import DENSITY_GEOHASH_PRECISION, DensityIndex, build_index
+from .hotel_vendor_request.extractor import HotelExtractor
+from .hotel_vendor_request.page_index import build_hotel_index, dumps, mmap_range_fetcher, parse_fragment, read_hotels
+from .hotel_vendor_request.scheduler import scheduler
+from .hotel_vendor_request.streaming import ChunkScan, PageScan
+
+GDS_NAMESPACES = {
+    "x": "http://schemas.xmlsoap.org/soap/envelope/",
+    "y": "http://www.travelport.com/schema/hotel_v52_0",
+    "z": "http://www.travelport.com/schema/common_v52_0",
+}
+GDS_REQUEST_MAPPING = {
+    "result": "/x:Envelope/x:Body/y:HotelSearchAvailabilityRsp/y:HotelSearchResult",
+    "error": "/x:Envelope/x:Body/x:Fault/faultstring",
+    "namespaces": GDS_NAMESPACES,
+    "next_page_reference": "/x:Envelope/x:Body/y:HotelSearchAvailabilityRsp/z:NextResultReference",
+}
+
+
+def build_sample_response(hotel_count, namespaces=GDS_NAMESPACES):
+    """Synthetic HotelSearchAvailabilityRsp with hotel_count results, shaped like a uAPI response."""
+    hotel = (
+        '<y:HotelSearchResult><y:HotelProperty HotelChain="MC" HotelCode="{code}" HotelLocation="LAS" Name="Hotel {code}" '
+        'VendorLocationKey="k{code}" HotelTransportation="Shuttle" ReserveRequirement="Other" ParticipationLevel="Best Available Rate">'
+        "<y:PropertyAddress><y:Address>3535 S Las Vegas Blvd</y:Address><y:Address>Las Vegas NV 89109</y:Address></y:PropertyAddress>"
+        '<z:PhoneNumber Type="Business" Number="702-555-0100"/><z:Distance Units="KM" Value="3" Direction="NE"/>'
+        '<y:HotelRating RatingProvider="AAA"><y:Rating>3</y:Rating></y:HotelRating>'
+        '<y:Amenities>' + "".join(f'<y:Amenity Code="{code}"/>' for code in range(20)) + "</y:Amenities>"
+        "</y:HotelProperty>"
+        '<y:RateInfo MinimumAmount="USD120.00" ApproximateMinimumStayAmount="USD120.00" ApproximateMaximumAmount="USD320.00"/>'
+        '<y:MediaItem caption="Exterior" height="150" width="150" type="jpg" url="https://example.com/{code}.jpg"/>'
+        "</y:HotelSearchResult>"
+    )
+    return (
+        f'<x:Envelope xmlns:x="{namespaces["x"]}"><x:Body>'
+        f'<y:HotelSearchAvailabilityRsp xmlns:y="{namespaces["y"]}" xmlns:z="{namespaces["z"]}" TraceId="12345">'
+        '<z:NextResultReference ProviderCode="1G">H4sIAAAAAAAAAA==</z:NextResultReference>'
+        + "".join(hotel.format(code=f"{index:05d}") for index in range(hotel_count))
+        + "</y:HotelSearchAvailabilityRsp></x:Body></x:Envelope>"
+    ).encode("utf-8")
+
+
+def _dom_path(content, request_mapping):
+    """The DOM path: full parse of the page, deep copy for the details thread, xpath per hotel."""
+    namespaces = request_mapping["namespaces"]
+    root = etree.parse(BytesIO(content)).getroot()
+    root.xpath(request_mapping["error"], namespaces=namespaces)
+    root.xpath(request_mapping["next_page_reference"], namespaces=namespaces)
+    root_copy = copy.deepcopy(root)
+    return [
+        hotel.xpath("y:HotelProperty/@HotelCode", namespaces=namespaces)[0]
+        for hotel in root_copy.xpath(request_mapping["result"], namespaces=namespaces)
+    ]
+
+
+def _stream_path(content, request_mapping):
+    namespaces = request_mapping["namespaces"]
+    # str() drops the reference lxml smart strings keep to their element, which would keep cleared hotels alive
+    return [
+        str(hotel.xpath("y:HotelProperty/@HotelCode", namespaces=namespaces)[0])
+        for hotel in PageScan(content, request_mapping).results()
+    ]
+
+
+def _measure(mode, hotel_count, request_mapping, connection):
+    content = build_sample_response(hotel_count, request_mapping["namespaces"])
+    path = _dom_path if mode == "dom" else _stream_path
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    hotel_ids = path(content, request_mapping)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    connection.send({"mode": mode, "hotels": len(hotel_ids), "seconds": round(elapsed, 4), "peak_memory_kb": peak})
+
+
+def benchmark_streaming(request_mapping=GDS_REQUEST_MAPPING, hotel_count=2000):
+    """
+    Compare the DOM path with the streaming path on a synthetic page, each in a fresh process so the
+    peak memory of one does not hide the other.
+    """
+    results = []
+    for mode in ("dom", "stream"):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_measure, args=(mode, hotel_count, request_mapping, sender))
+        process.start()
+        results.append(receiver.recv())
+        process.join()
+    return results
+
+
+def _three_parse_split(content, item_xpath, namespaces, chunk_size):
+    """
+    The former desiya flow: full parse for the error check, second full parse for the split, chunks moved into
+    new roots, pretty printed and parsed again.
+    """
+    etree.parse(BytesIO(content)).getroot()
+    root = etree.parse(BytesIO(content), etree.XMLParser(remove_blank_text=True)).getroot()
+    items = root.xpath(item_xpath, namespaces=namespaces)
+    chunks = []
+    for start in range(0, len(items), chunk_size):
+        chunk_root = etree.Element(root.tag, nsmap=namespaces)
+        for item in items[start : start + chunk_size]:
+            chunk_root.append(item)
+        data = etree.tostring(chunk_root, pretty_print=True)
+        chunks.append((data, etree.parse(BytesIO(data)).getroot()))
+    return chunks
+
+
+def benchmark_chunks(room_stay_count=5000, chunk_size=10):
+    """Time of the former desiya split, which parses the response three times, against ChunkScan."""
+    namespaces = {"x": "http://schemas.xmlsoap.org/soap/envelope/", "y": "http://www.opentravel.org/OTA/2003/05"}
+    item_xpath = "/x:Envelope/x:Body/y:OTA_HotelAvailRS/y:RoomStays/y:RoomStay"
+    error_xpath = "/x:Envelope/x:Body/y:OTA_HotelAvailRS/y:Errors/y:Error"
+    room_stay = (
+        '<RoomStay><RoomTypes><RoomType RoomTypeCode="DLX"><RoomDescription Name="Deluxe"/></RoomType></RoomTypes>'
+        '<RoomRates><RoomRate RatePlanCode="BAR"><Rates><Rate><Base AmountBeforeTax="4500" CurrencyCode="INR"/></Rate>'
+        '</Rates></RoomRate></RoomRates><BasicPropertyInfo HotelCode="{code}" HotelName="Hotel {code}">'
+        '<Address><AddressLine>MG Road</AddressLine><CityName>Bangalore</CityName></Address></BasicPropertyInfo></RoomStay>\n'
+    )
+    content = (
+        f'<soap:Envelope xmlns:soap="{namespaces["x"]}"><soap:Body><OTA_HotelAvailRS xmlns="{namespaces["y"]}"><RoomStays>'
+        + "".join(room_stay.format(code=index) for index in range(room_stay_count))
+        + "</RoomStays></OTA_HotelAvailRS></soap:Body></soap:Envelope>"
+    ).encode("utf-8")
+
+    start = time.perf_counter()
+    former = _three_parse_split(content, item_xpath, namespaces, chunk_size)
+    former_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunk_scan = ChunkScan(content, item_xpath, error_xpath, namespaces, chunk_size)
+    chunks = list(chunk_scan.chunks())
+    single_pass_seconds = time.perf_counter() - start
+
+    hotel_codes = etree.XPath("/x:Envelope/y:RoomStay/y:BasicPropertyInfo/@HotelCode", namespaces=namespaces)
+    assert [hotel_codes(root) for _, root in former] == [hotel_codes(root) for _, root in chunks]
+    return {
+        "room_stays": room_stay_count,
+        "chunks": len(chunks),
+        "three_parse_seconds": round(former_seconds, 4),
+        "single_pass_seconds": round(single_pass_seconds, 4),
+        "three_parse_bytes": sum(len(data) for data, _ in former),
+        "single_pass_bytes": sum(len(data) for data, _ in chunks),
+    }
+
+
+def benchmark_index(hotel_count=2000, wanted=5):
+    """Bytes read and time to get the records of a batch from an indexed page, against a full parse."""
+    result_xpath = GDS_REQUEST_MAPPING["result"]
+    extractor = HotelExtractor(
+        result_xpath, GDS_NAMESPACES, {"hotel_id": "y:HotelProperty/@HotelCode", "hotel_chain": "y:HotelProperty/@HotelChain"}
+    )
+    content = build_sample_response(hotel_count)
+    hotel_ids = [record.hotel_id for record in extractor.extract(etree.fromstring(content))]
+    index = build_hotel_index(content, hotel_ids, result_xpath, "sample.xml")
+    batch = hotel_ids[hotel_count // 2 : hotel_count // 2 + wanted]
+
+    start = time.perf_counter()
+    records = [record for record in extractor.extract(etree.fromstring(content)) if record.hotel_id in batch]
+    full_seconds = time.perf_counter() - start
+
+    with tempfile.NamedTemporaryFile(suffix=".xml") as file:
+        file.write(content)
+        file.flush()
+        fetch_range = mmap_range_fetcher(file.name)
+        read = []
+
+        def counting_fetch(range_start, range_end):
+            read.append(range_end - range_start)
+            return fetch_range(range_start, range_end)
+
+        start = time.perf_counter()
+        fragments = read_hotels(json.loads(dumps(index)), batch, counting_fetch)
+        ranged = extractor.records(parse_fragment(index, fragment) for fragment in fragments.values())
+        ranged_seconds = time.perf_counter() - start
+
+    assert sorted(ranged) == sorted(records)
+    return {
+        "page_bytes": len(content),
+        "index_bytes": len(dumps(index)),
+        "full_read_bytes": len(content),
+        "range_read_bytes": sum(read),
+        "range_reads": len(read),
+        "full_parse_seconds": round(full_seconds, 5),
+        "range_parse_seconds": round(ranged_seconds, 5),
+    }
+
+
+def benchmark_archive(pages=20, hotel_count=500, root=ARCHIVE_LOCAL_ROOT):
+    """
+    Time the page loop spends archiving with synchronous uploads and with the archival stage, on the local
+    backend, for every compression.
+    """
+    content = build_sample_response(hotel_count)
+    results = []
+    for compression in ("none", "gzip", "zstd"):
+        archiver = Archiver(LocalBackend(root), compression)
+        start = time.perf_counter()
+        for page in range(pages):
+            archiver.save("benchmark", f"sync/{compression}/{page}.xml", content)
+        synchronous = time.perf_counter() - start
+
+        start = time.perf_counter()
+        futures = [archiver.submit("benchmark", f"async/{compression}/{page}.xml", content) for page in range(pages)]
+        critical_path = time.perf_counter() - start
+        metadata = [scheduler.join(future) for future in futures]
+        durable = time.perf_counter() - start
+
+        stored = archiver.stats()
+        assert decompress(open(metadata[-1]["path"], "rb").read(), metadata[-1].get("compression", "none")) == content
+        results.append(
+            {
+                "compression": metadata[-1].get("compression", "none"),
+                "page_bytes": len(content),
+                "stored_bytes": stored["stored_bytes"] // stored["uploads"],
+                "sync_seconds": round(synchronous, 4),
+                "async_critical_path_seconds": round(critical_path, 4),
+                "async_durable_seconds": round(durable, 4),
+            }
+        )
+    return results
+
+
+def benchmark_grid(cases=((36.171563, -115.1391009, 30, 3), (12.9716, 77.5946, 50, 3), (64.1466, -21.9426, 10, 2)), rounds=5):
+    """
+    Check generate_hexagonal_grid against the point by point geodesic version and time both, and compare the
+    coverage of the recursive grid with the coverage plan.
+    """
+    grid_division_factor = lat_long_grid_derivation.GRID_DIVISION_FACTOR
+    versions = (
+        ("scalar", lat_long_grid_derivation._generate_hexagonal_grid_scalar),
+        ("vectorised", lat_long_grid_derivation.generate_hexagonal_grid),
+    )
+    results = []
+    for lat, lng, radius, depth in cases:
+        radii = [radius / grid_division_factor**level for level in range(depth)]
+        identical = all(
+            versions[0][1](lat, lng, level_radius, level_radius / grid_division_factor)
+            == versions[1][1](lat, lng, level_radius, level_radius / grid_division_factor)
+            for level_radius in radii
+        )
+        timings = {}
+        for name, grid in versions:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for level_radius in radii:
+                    grid(lat, lng, level_radius, level_radius / grid_division_factor)
+            timings[name] = round((time.perf_counter() - start) / (rounds * len(radii)), 6)
+
+        recursive_grid = lat_long_grid_derivation.get_equivalent_smaller_grids(lat, lng, radius, depth)
+        coverage_plan = lat_long_grid_derivation.plan_coverage(lat, lng, radius, depth)
+        results.append(
+            {
+                "case": (lat, lng, radius, depth),
+                "identical": identical,
+                "seconds_per_grid": timings,
+                "recursive_grid_calls": len(recursive_grid),
+                "recursive_grid_coverage": round(
+                    lat_long_grid_derivation.coverage_ratio(lat, lng, radius, [(a, b, int(r)) for a, b, r in recursive_grid]), 4
+                ),
+                "coverage_plan_calls": len(coverage_plan),
+                "coverage_plan_coverage": round(lat_long_grid_derivation.coverage_ratio(lat, lng, radius, coverage_plan), 4),
+            }
+        )
+    return results
+
+
+def density_index(output_path, vendor, patterns, precision=DENSITY_GEOHASH_PRECISION):
+    """Build or extend the density index from the archived pages matching patterns, and time loading it."""
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern, recursive=True)})
+    summary = build_index(output_path, vendor, paths, precision)
+    start = time.perf_counter()
+    DensityIndex.load(output_path)
+    summary["load_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks and offline tools of the hotel vendor request modules")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("streaming").add_argument("--hotels", type=int, nargs="+", default=[500, 5000])
+    commands.add_parser("chunks")
+    commands.add_parser("page-index")
+    commands.add_parser("archive")
+    commands.add_parser("grid")
+    density_parser = commands.add_parser("density-index", help="build the hotel density index from archived search pages")
+    density_parser.add_argument("--vendor", required=True)
+    density_parser.add_argument("--output", required=True)
+    density_parser.add_argument("--precision", type=int, default=DENSITY_GEOHASH_PRECISION)
+    density_parser.add_argument("patterns", nargs="+", help="glob patterns of the archived page XMLs")
+    args = parser.parse_args()
+
+    if args.command == "streaming":
+        results = [result for count in args.hotels for result in benchmark_streaming(hotel_count=count)]
+    elif args.command == "chunks":
+        results = [benchmark_chunks()]
+    elif args.command == "page-index":
+        results = [benchmark_index()]
+    elif args.command == "archive":
+        results = benchmark_archive()
+    elif args.command == "grid":
+        results = benchmark_grid()
+    else:
+        results = [density_index(args.output, args.vendor, args.patterns, args.precision)]
+    for result in results:
+        print(result)
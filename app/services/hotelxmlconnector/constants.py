@@ -1,2 +1,9 @@
 SERVICE_NAME = "hotelxmlconnector"
 SOAP_CLIENT_INIT_EVENT_NAME = "SoapClientInit"
+SOAP_SCHEMA_COMPILE_EVENT_NAME = "SoapSchemaCompile"
+VENDOR_HTTP_CONNECTION_STATS_EVENT_NAME = "VendorHTTPConnectionStats"
+HOTEL_DEDUPE_EVENT_NAME = "HotelDedupe"
+GRID_PLAN_EVENT_NAME = "HotelGridPlan"
+SCHEDULER_STATS_EVENT_NAME = "HotelSchedulerStats"
+VENDOR_RATE_LIMIT_EVENT_NAME = "VendorRateLimit"
+ARCHIVE_STATS_EVENT_NAME = "HotelArchiveStats"
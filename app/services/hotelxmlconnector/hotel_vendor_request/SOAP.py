@@ -1,21 +1,71 @@
 import base64
+import collections
+import contextlib
+import copy
+import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import traceback
 from datetime import datetime
 
 import helperlayer as helpers
 import newrelic.agent
 from helperlayer import push_newrelic_custom_event
-from requests import Session
-from zeep import Client, Transport
+from opensearchlogger.logging import logger
+from zeep import Client, Settings, Transport
 
 from app.services.hotelxmlconnector import constants
+from app.services.hotelxmlconnector.hotel_vendor_request import capture, schema_bundle, transport
 
 _hotel_vendor_reqs_soap_manager_instances = {}
-POOL_SIZE = 40  # Maximum SOAPManager instances
+_compiled_wsdl_clients = {}
+_compiled_wsdl_lock = threading.Lock()
+POOL_MIN_SIZE = int(os.getenv("SOAP_POOL_MIN_SIZE", 2))  # SOAPManager instances kept warm
+POOL_MAX_SIZE = int(os.getenv("SOAP_POOL_MAX_SIZE", 40))  # Maximum SOAPManager instances
+POOL_IDLE_TIMEOUT = float(os.getenv("SOAP_POOL_IDLE_TIMEOUT", 300))  # In sec
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("SOAP_POOL_HEALTH_CHECK_INTERVAL", 30))  # In sec
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("SOAP_POOL_CHECKOUT_TIMEOUT", 60))  # In sec
 MAX_RETRIES = 2  # Retry connection setup
 
 
+def get_compiled_client(wsdl_url, settings=None):
+    """
+    Parse a WSDL and its XSD imports once per process.
+
+    The precompiled schema bundle is used when one was built for the WSDL and is still fresh, otherwise the
+    WSDL is parsed live. The returned client is a read-only template. SOAPManager instances take a shallow copy of it and attach
+    their own transport, so the parsed document and type registry are shared by every pooled manager.
+
+    Args:
+        wsdl_url (str): WSDL URL or path of the SOAP service.
+        settings: zeep settings, only the parser related options are part of the cache key.
+
+    Returns:
+        Client: The compiled template client.
+    """
+    settings = settings or Settings()
+    key = (wsdl_url, settings.strict, settings.xml_huge_tree)
+    template = _compiled_wsdl_clients.get(key)
+    if template is not None:
+        return template
+
+    with _compiled_wsdl_lock:
+        if key not in _compiled_wsdl_clients:
+            start_time = datetime.now()
+            template = schema_bundle.load_compiled_client(wsdl_url, settings)
+            is_bundle = template is not None
+            if not is_bundle:
+                template = Client(wsdl_url, transport=Transport(), settings=settings)
+            _compiled_wsdl_clients[key] = template
+            time_delta = (datetime.now() - start_time).total_seconds()
+            push_newrelic_custom_event(
+                newrelic.agent,
+                constants.SOAP_SCHEMA_COMPILE_EVENT_NAME,
+                {"module": constants.SERVICE_NAME, "latency": round(time_delta, 6), "wsdl": wsdl_url, "is_bundle": is_bundle},
+            )
+        return _compiled_wsdl_clients[key]
+
+
 class SOAPManager:
     _lock = threading.Lock()
 
@@ -28,25 +78,31 @@ class SOAPManager:
         self.service_url = service_url
         self.client = None
         self.binding_service = None
+        self.last_used = time.monotonic()
 
     def connect(self):
         """Connect to the SOAP service."""
         if self.client:
             return  # Avoid reconnecting if already connected
-        session = Session()
         auth_bytes = bytes(
             f"{self.username}:{self.password}",
             encoding="utf-8",
         )
         auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
-        session.headers = {"Authorization": "Basic " + auth_base64}
-
-        self.client = Client(
-            self.wsdl_url,
-            transport=Transport(session=session),
-            settings=self.settings,
+        # Pooled managers of the same account share one keep-alive session and its connection pool.
+        session = transport.get_session(
+            (self.service_url, self.username),
+            {"Authorization": "Basic " + auth_base64},
         )
 
+        # Only the transport is per instance, the parsed WSDL document is shared.
+        client = copy.copy(get_compiled_client(self.wsdl_url, self.settings))
+        client.transport = capture.CaptureTransport(session=session, operation_timeout=transport.HTTP_TIMEOUT)
+        client.plugins = list(client.plugins)
+        if self.settings is not None:
+            client.settings = self.settings
+        self.client = client
+
     def disconnect(self):
         """Disconnect from the SOAP service."""
         self.client = None
@@ -63,12 +119,33 @@ class SOAPManager:
         Returns:
             The response from the SOAP service.
         """
+        self.bind(service_name)
+        return self.binding_service.service(**request)
+
+    def post(self, service_name, body, headers):
+        """
+        Post an already serialised envelope over the manager's transport.
+
+        Args:
+            service_name (str): The name of the service.
+            body (bytes): The SOAP envelope.
+            headers (dict): HTTP headers of the operation, e.g. SOAPAction.
+
+        Returns:
+            The raw HTTP response of the SOAP service.
+        """
+        self.bind(service_name)
+        return self.client.transport.post(self.service_url, body, headers)
+
+    def bind(self, service_name):
+        """Ensure the connection and the binding service of service_name are active."""
         if self.client is None or self.binding_service is None:
-            # Ensure the connection and binding service are active.
             self.connect()
             self.binding_service = self.create_service(service_name)
 
-        return self.binding_service.service(**request)
+    def is_healthy(self):
+        """Whether the manager holds a usable client."""
+        return self.client is not None and self.client.wsdl is not None
 
     def create_service(self, service_name):
         """
@@ -100,9 +177,9 @@ class SOAPManager:
         return self.client.create_message(self.binding_service, message_name, **kwargs)
 
     @classmethod
-    def get_instance(cls, wsdl_url, service_url, username, password, settings):
+    def get_pool(cls, wsdl_url, service_url, username, password, settings):
         """
-        Retrieve a SOAPManager instance from the pool.
+        Retrieve the SOAPManager pool of the specified service, creating it on first use.
 
         Args:
             wsdl_url (str): WSDL URL of the SOAP service.
@@ -112,72 +189,213 @@ class SOAPManager:
             settings: Additional SOAP client settings.
 
         Returns:
-            SOAPManager: An instance from the pool.
+            SOAPManagerPool: The pool to lease managers from.
         """
-        global _hotel_vendor_reqs_soap_manager_instances
         start_time = datetime.now()
-        is_cache = cls.initialize_pool(wsdl_url, service_url, username, password, settings)
         key = (wsdl_url, service_url, username)
-        with cls._lock:
-            pool, current_index = _hotel_vendor_reqs_soap_manager_instances[key]
-            if not pool or not all(manager.client and manager.client.wsdl for manager in pool):
-                # cache is corrupted, force initialise.
-                is_cache = cls.initialize_pool(wsdl_url, service_url, username, password, settings, True)
-                pool, current_index = _hotel_vendor_reqs_soap_manager_instances[key]
-            _hotel_vendor_reqs_soap_manager_instances[key] = (pool, (current_index + 1) % len(pool))
-
-        client = pool[current_index]
+        pool = _hotel_vendor_reqs_soap_manager_instances.get(key)
+        is_cache = pool is not None
+        if pool is None:
+            with cls._lock:
+                pool = _hotel_vendor_reqs_soap_manager_instances.get(key)
+                if pool is None:
+                    pool = SOAPManagerPool(lambda: cls(wsdl_url, service_url, username, password, settings))
+                    _hotel_vendor_reqs_soap_manager_instances[key] = pool
+
         time_delta = (datetime.now() - start_time).total_seconds()
         push_newrelic_custom_event(
             newrelic.agent,
             constants.SOAP_CLIENT_INIT_EVENT_NAME,
-            {"module": constants.SERVICE_NAME, "latency": round(time_delta, 6), "is_cache": is_cache},
+            {"module": constants.SERVICE_NAME, "latency": round(time_delta, 6), "is_cache": is_cache, **pool.metrics()},
         )
-        return client
-
-    @classmethod
-    def initialize_pool(cls, wsdl_url, service_url, username, password, settings, force_init=False):
+        return pool
+
+
+class SOAPManagerPool:
+    """
+    Elastic, health-checked pool of connected SOAPManager instances for one (wsdl, service_url, username) key.
+
+    Managers are leased: a checked out manager belongs to a single thread until it is released. Idle managers
+    sit in a deque whose append/pop are atomic, so checkout takes no pool-wide lock. A bounded semaphore caps
+    the leases at max_size and is only waited on once every manager is in use. The pool grows on demand, and a
+    background thread evicts managers idle for longer than idle_timeout (down to min_size) and drops broken ones.
+    """
+
+    def __init__(
+        self,
+        factory,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        health_check_interval=POOL_HEALTH_CHECK_INTERVAL,
+    ):
+        self._factory = factory
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = collections.deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = threading.Event()
+        # Guards the counters below only, it is never held while waiting or creating managers.
+        self._stats_lock = threading.Lock()
+        self._size = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._created = 0
+        self._evicted = 0
+        self._creation_latency_total = 0.0
+        self._creation_latency_last = 0.0
+
+        threading.Thread(target=self._health_check_loop, name="soap-pool-health-check", daemon=True).start()
+
+    def acquire(self, timeout=POOL_CHECKOUT_TIMEOUT):
         """
-        Initialize a pool of SOAPManager instances for the specified service.
+        Check out a manager, creating one if none is idle and the pool is below max_size.
 
         Args:
-            wsdl_url (str): WSDL URL of the SOAP service.
-            service_url (str): SOAP service endpoint URL.
-            username (str): Username for authentication.
-            password (str): Password for authentication.
-            settings: Additional SOAP client settings.
-            force_init (bool): Force reinitialization of the pool.
+            timeout (float): Seconds to wait for a manager once the pool is exhausted.
 
         Returns:
-            bool: True if the pool was retrieved from cache, False if it was reinitialized.
+            SOAPManager: A connected manager owned by the caller until release() is called.
         """
-        global _hotel_vendor_reqs_soap_manager_instances
-
-        def create_and_connect_manager():
-            """
-            Create and connect a SOAPManager instance with retries.
-            """
-            manager = cls(wsdl_url, service_url, username, password, settings)
-            for attempt in range(MAX_RETRIES):
-                try:
-                    manager.connect()
-                    return manager
-                except Exception as e:
-                    if attempt == MAX_RETRIES - 1:
-                        raise RuntimeError(f"Failed to initialize SOAPManager: {e}")
-
-        key = (wsdl_url, service_url, username)
-        is_cache = True
-
-        with cls._lock:
-            if force_init or key not in _hotel_vendor_reqs_soap_manager_instances:
-                is_cache = False
-                pool = []
-
-                with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
-                    futures = [executor.submit(create_and_connect_manager) for _ in range(POOL_SIZE)]
-                    [pool.append(future.result()) for future in as_completed(futures)]
-
-                _hotel_vendor_reqs_soap_manager_instances[key] = pool, 0
+        if not self._slots.acquire(blocking=False):
+            self._update_stats(waiters=1)
+            try:
+                if not self._slots.acquire(timeout=timeout):
+                    raise TimeoutError(f"No SOAPManager available within {timeout}s, pool max size is {self.max_size}")
+            finally:
+                self._update_stats(waiters=-1)
+        try:
+            manager = self._pop_idle() or self._create()
+        except Exception:
+            self._slots.release()
+            raise
+        self._update_stats(in_use=1)
+        return manager
+
+    def release(self, manager):
+        """Return a leased manager to the pool."""
+        manager.last_used = time.monotonic()
+        if manager.is_healthy():
+            self._idle.append(manager)
+        else:
+            self._discard(manager)
+        self._update_stats(in_use=-1)
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def lease(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """Context manager checking out a manager for the duration of the block."""
+        manager = self.acquire(timeout)
+        try:
+            yield manager
+        finally:
+            self.release(manager)
+
+    def metrics(self):
+        """Snapshot of the pool usage."""
+        with self._stats_lock:
+            return {
+                "pool_size": self._size,
+                "pool_idle": len(self._idle),
+                "pool_in_use": self._in_use,
+                "pool_waiters": self._waiters,
+                "pool_created": self._created,
+                "pool_evicted": self._evicted,
+                "pool_creation_latency_last": round(self._creation_latency_last, 6),
+                "pool_creation_latency_avg": round(self._creation_latency_total / self._created, 6) if self._created else 0,
+            }
+
+    def check_health(self):
+        """
+        Drop broken idle managers, evict the ones idle for too long and top the pool up to min_size.
 
-        return is_cache
+        The check holds a lease slot for every manager it takes out of the idle deque or creates, like a caller
+        of acquire(), so a manager being checked or created counts against max_size. When every slot is leased
+        the pool is busy anyway, and the rest of the check waits for the next round.
+        """
+        now = time.monotonic()
+        for _ in range(len(self._idle)):
+            if not self._slots.acquire(blocking=False):
+                return
+            try:
+                try:
+                    manager = self._idle.popleft()
+                except IndexError:
+                    break
+                expired = now - manager.last_used > self.idle_timeout and self._size > self.min_size
+                if expired or not manager.is_healthy():
+                    self._discard(manager)
+                else:
+                    self._idle.append(manager)
+            finally:
+                self._slots.release()
+
+        while self._size < self.min_size and not self._closed.is_set():
+            if not self._slots.acquire(blocking=False):
+                return
+            try:
+                self._idle.appendleft(self._create())
+            finally:
+                self._slots.release()
+
+    def close(self):
+        """Stop the health check and drop every idle manager."""
+        self._closed.set()
+        while self._idle:
+            self._discard(self._idle.pop())
+
+    def _health_check_loop(self):
+        while not self._closed.is_set():
+            try:
+                self.check_health()
+            except Exception:
+                logger.error(f"SOAPManager pool health check failed: {traceback.format_exc()}")
+            self._closed.wait(self.health_check_interval)
+
+    def _pop_idle(self):
+        while True:
+            try:
+                manager = self._idle.pop()
+            except IndexError:
+                return None
+            if manager.is_healthy():
+                return manager
+            self._discard(manager)
+
+    def _create(self):
+        """Create and connect a SOAPManager instance with retries."""
+        start_time = time.monotonic()
+        # Counted from the start, so the health check top-up sees the managers still connecting
+        with self._stats_lock:
+            self._size += 1
+        for attempt in range(MAX_RETRIES):
+            try:
+                manager = self._factory()
+                manager.connect()
+                break
+            except Exception as e:
+                if attempt == MAX_RETRIES - 1:
+                    with self._stats_lock:
+                        self._size -= 1
+                    raise RuntimeError(f"Failed to initialize SOAPManager: {e}") from e
+        manager.last_used = time.monotonic()
+        latency = manager.last_used - start_time
+        with self._stats_lock:
+            self._created += 1
+            self._creation_latency_total += latency
+            self._creation_latency_last = latency
+        return manager
+
+    def _discard(self, manager):
+        manager.disconnect()
+        with self._stats_lock:
+            self._size -= 1
+            self._evicted += 1
+
+    def _update_stats(self, in_use=0, waiters=0):
+        with self._stats_lock:
+            self._in_use += in_use
+            self._waiters += waiters
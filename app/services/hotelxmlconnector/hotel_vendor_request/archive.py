@@ -0,0 +1,211 @@
+import gzip
+import os
+import random
+import threading
+import time
+import traceback
+from io import BytesIO
+
+from opensearchlogger.logging import logger
+
+from .scheduler import PUBLISH_LANE, scheduler
+
+try:
+    import zstandard
+except ImportError:  # zstd compression falls back to gzip
+    zstandard = None
+
+ARCHIVE_BACKEND = os.getenv("HOTEL_ARCHIVE_BACKEND", "s3connector")  # s3connector, s3 or local
+ARCHIVE_LOCAL_ROOT = os.getenv("HOTEL_ARCHIVE_LOCAL_ROOT", "/tmp/hotel_archive")  # Root folder of the local backend
+ARCHIVE_COMPRESSION = os.getenv("HOTEL_ARCHIVE_COMPRESSION", "none")  # none, gzip or zstd
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("HOTEL_ARCHIVE_COMPRESSION_LEVEL", 3))
+ARCHIVE_MULTIPART_THRESHOLD = int(os.getenv("HOTEL_ARCHIVE_MULTIPART_THRESHOLD", 8 * 1024 * 1024))  # In bytes
+ARCHIVE_MULTIPART_CHUNK_SIZE = int(os.getenv("HOTEL_ARCHIVE_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024))  # In bytes
+ARCHIVE_RETRIES = int(os.getenv("HOTEL_ARCHIVE_RETRIES", 3))  # Attempts after the first one
+ARCHIVE_RETRY_BACKOFF = float(os.getenv("HOTEL_ARCHIVE_RETRY_BACKOFF", 0.5))  # In sec, doubled on every retry
+
+CONTENT_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+
+def compress(content, compression, level=ARCHIVE_COMPRESSION_LEVEL):
+    """
+    Compressed body of an archived object
+    :param content: str or bytes
+    :param compression: none, gzip or zstd, zstd without zstandard installed is gzip
+    :param level: compression level
+    :return: (bytes, compression actually applied)
+    """
+    body = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+    if compression == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(body), "zstd"
+    if compression in ("gzip", "zstd"):
+        return gzip.compress(body, compresslevel=level), "gzip"
+    return body, "none"
+
+
+def decompress(body, compression):
+    """
+    Original content of an archived object, for the consumers reading it back
+    :param body: bytes as stored
+    :param compression: the compression of its metadata
+    :return: bytes
+    """
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    if compression == "gzip":
+        return gzip.decompress(body)
+    return body
+
+
+class S3ConnectorBackend:
+    """The S3Threading upload of the helper layer, the metadata it returns is the one published until now."""
+
+    def __init__(self):
+        from s3connector import S3Threading
+
+        self.s3 = S3Threading()
+
+    def put(self, bucket, key, body):
+        return self.s3.save_to_s3(bucket, key, body)
+
+
+class S3Backend:
+    """boto3 upload, bodies over the multipart threshold are streamed as parts uploaded concurrently."""
+
+    def __init__(self):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.client = boto3.client("s3")
+        self.transfer_config = TransferConfig(
+            multipart_threshold=ARCHIVE_MULTIPART_THRESHOLD,
+            multipart_chunksize=ARCHIVE_MULTIPART_CHUNK_SIZE,
+            max_concurrency=4,
+        )
+
+    def put(self, bucket, key, body):
+        self.client.upload_fileobj(BytesIO(body), bucket, key, Config=self.transfer_config)
+        return {"bucket": bucket, "key": key}
+
+
+class LocalBackend:
+    """Objects written under a local folder, to benchmark and test the archival without AWS."""
+
+    def __init__(self, root=ARCHIVE_LOCAL_ROOT):
+        self.root = root
+
+    def put(self, bucket, key, body):
+        path = os.path.join(self.root, bucket or "default", key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{threading.get_ident()}.part"
+        with open(temporary_path, "wb") as file:
+            file.write(body)
+            file.flush()
+            os.fsync(file.fileno())
+        # The object only appears complete, like an S3 put
+        os.replace(temporary_path, path)
+        return {"bucket": bucket, "key": key, "path": path}
+
+
+BACKENDS = {"s3connector": S3ConnectorBackend, "s3": S3Backend, "local": LocalBackend}
+
+
+class Archiver:
+    """
+    Archival stage of the raw vendor pages.
+
+    submit() queues the upload on the publish lane and returns at once, so the error check and the pagination
+    of the page go on while it is uploaded. The returned future resolves to the metadata of the object once the
+    backend has stored it, the publishing threads resolve it before building their messages, so s3_metadata only
+    reaches the consumers for an object they can read. Bodies are compressed on the publish lane as well, the
+    metadata then carries the compression and the key its suffix. Failed uploads are retried with exponential
+    backoff and jitter.
+    """
+
+    def __init__(self, backend=None, compression=ARCHIVE_COMPRESSION, retries=ARCHIVE_RETRIES, retry_backoff=ARCHIVE_RETRY_BACKOFF):
+        self.backend = backend or BACKENDS[ARCHIVE_BACKEND]()
+        self.compression = compression
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.failures = 0
+        self.retried = 0
+        self.content_bytes = 0
+        self.stored_bytes = 0
+
+    def save(self, bucket, key, content, compression=None):
+        """
+        Store one object, on the calling thread
+        :param bucket: S3 bucket
+        :param key: object key, without the compression suffix
+        :param content: str or bytes
+        :param compression: compression of this object, the archiver's by default
+        :return: metadata of the stored object
+        """
+        body, compression = compress(content, compression or self.compression)
+        key = key + CONTENT_SUFFIXES.get(compression, "")
+        attempt = 0
+        while True:
+            try:
+                metadata = self.backend.put(bucket, key, body)
+                break
+            except Exception:
+                if attempt >= self.retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self.retry_backoff * 2**attempt * random.uniform(0.5, 1.5)
+                logger.info(f"Archiving {key} failed, retrying in {delay:.2f} sec: {traceback.format_exc()}")
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+                time.sleep(delay)
+
+        with self._lock:
+            self.uploads += 1
+            self.content_bytes += len(content)
+            self.stored_bytes += len(body)
+        if compression != "none" and isinstance(metadata, dict):
+            metadata = {**metadata, "compression": compression}
+        return metadata
+
+    def submit(self, bucket, key, content):
+        """
+        Store one object on the publish lane
+        :param bucket: S3 bucket
+        :param key: object key, without the compression suffix
+        :param content: str or bytes
+        :return: future of the metadata, resolve it with scheduler.join
+        """
+        return scheduler.submit(PUBLISH_LANE, self.save, bucket, key, content)
+
+    def stats(self):
+        """
+        Counters of the uploads since the start of the process
+        :return: dict with uploads, failures, retried, content and stored bytes
+        """
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "failures": self.failures,
+                "retried": self.retried,
+                "content_bytes": self.content_bytes,
+                "stored_bytes": self.stored_bytes,
+            }
+
+
+def get_archiver():
+    """
+    The process-wide archiver, created on first use
+    :return: Archiver
+    """
+    global _archiver
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = Archiver()
+    return _archiver
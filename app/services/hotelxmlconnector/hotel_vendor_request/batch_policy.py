@@ -0,0 +1,102 @@
+import math
+import os
+import threading
+
+BATCH_SIZE_MODE = os.getenv("HOTEL_DETAILS_BATCH_SIZE_MODE", "fixed")  # fixed or adaptive
+SMOOTHING = 0.2
+
+
+class BatchSizePolicy:
+    """
+    Hotels per hotel details message of one vendor.
+
+    In adaptive mode the size is the largest one keeping a message under target_bytes, from the observed bytes
+    per hotel, and keeping one downstream details invocation under target_seconds, from the configured seconds per
+    hotel (no downstream timing reaches the connector, so that cap is static).
+    It is clamped to min_size..max_size, then the hotels of a page are spread evenly over the batches so the
+    last one is not a small remainder. In fixed mode every batch holds default_size hotels, as before.
+    Shared by all the locations of the vendor in the process.
+
+    Spec keys, the "batch_size" entry of VENDOR_REQUEST_MAPPING:
+    - default_size: size of the fixed mode
+    - min_size / max_size: bounds of the adaptive size
+    - target_bytes: message size to stay under
+    - target_seconds: downstream processing time of one message to stay under
+    - seconds_per_hotel: estimated downstream processing time of one hotel
+    """
+
+    def __init__(self, default_size, min_size, max_size, target_bytes, target_seconds, seconds_per_hotel, mode=BATCH_SIZE_MODE):
+        self.default_size = default_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.seconds_per_hotel = seconds_per_hotel
+        self.mode = mode
+        self.bytes_per_hotel = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_mapping(cls, request_mapping):
+        """
+        Policy of a VENDOR_REQUEST_MAPPING entry
+        :param request_mapping: vendor entry, with the batch_size spec
+        :return: BatchSizePolicy
+        """
+        return cls(**request_mapping["batch_size"])
+
+    def observe_message(self, message_bytes, hotels):
+        """
+        Record the size of a published message
+        :param message_bytes: serialised size of the message
+        :param hotels: hotels in the message
+        """
+        if not hotels or not message_bytes:
+            return
+        with self._lock:
+            sample = message_bytes / hotels
+            if self.bytes_per_hotel is None:
+                self.bytes_per_hotel = sample
+            else:
+                self.bytes_per_hotel += SMOOTHING * (sample - self.bytes_per_hotel)
+
+    def batch_size(self):
+        """Current hotels per message, before spreading a page over its batches."""
+        if self.mode != "adaptive":
+            return self.default_size
+        with self._lock:
+            size = self.max_size
+            if self.bytes_per_hotel:
+                size = min(size, int(self.target_bytes / self.bytes_per_hotel))
+        if self.seconds_per_hotel:
+            size = min(size, int(self.target_seconds / self.seconds_per_hotel))
+        return max(self.min_size, size)
+
+    def split(self, hotel_list):
+        """
+        Batches of a page of hotels, in order. The size is read once, so a resize from observe_message while the
+        page is published applies from the next page and the last batch of the list stays the last one published.
+        :param hotel_list: hotels of the page
+        :return: list of hotel lists
+        """
+        if not hotel_list:
+            return []
+        size = self.batch_size()
+        if self.mode == "adaptive":
+            size = math.ceil(len(hotel_list) / math.ceil(len(hotel_list) / size))
+        return [hotel_list[i : i + size] for i in range(0, len(hotel_list), size)]
+
+
+def summarize_sizes(batch_sizes):
+    """
+    Summary of the sizes of the published batches
+    :param batch_sizes: hotels of every batch
+    :return: dict with the batches, hotels, min, max and average size
+    """
+    return {
+        "batches": len(batch_sizes),
+        "hotels": sum(batch_sizes),
+        "min_batch_size": min(batch_sizes, default=0),
+        "max_batch_size": max(batch_sizes, default=0),
+        "avg_batch_size": round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0,
+    }
@@ -0,0 +1,41 @@
+import contextvars
+import os
+import random
+from collections import namedtuple
+
+from zeep import Transport
+
+WIRE_LOG_SAMPLE_RATE = float(os.getenv("WIRE_LOG_SAMPLE_RATE", 1))  # Share of search requests logged, 0 to 1
+WIRE_ARCHIVE_SAMPLE_RATE = float(os.getenv("WIRE_ARCHIVE_SAMPLE_RATE", 0))  # Share of search requests saved to S3, 0 to 1
+
+WireExchange = namedtuple("WireExchange", ["address", "request", "response", "status_code"])
+
+# Last exchange of the current thread, vendor calls of a search page run on a single thread.
+last_exchange = contextvars.ContextVar("last_exchange", default=None)
+
+
+def is_sampled(rate):
+    """
+    Whether the current exchange falls into the sample.
+
+    Args:
+        rate (float): Sample rate, 0 never samples and 1 always does.
+
+    Returns:
+        bool: True when the exchange is sampled.
+    """
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class CaptureTransport(Transport):
+    """
+    zeep transport keeping a reference to the exact bytes posted to and received from the vendor.
+
+    zeep serialises the envelope once to post it, the capture hands those same bytes to logging and S3 archival
+    instead of serialising the request a second time with create_message.
+    """
+
+    def post(self, address, message, headers):
+        response = super().post(address, message, headers)
+        last_exchange.set(WireExchange(address, message, response.content, response.status_code))
+        return response
@@ -1,26 +1,29 @@
-import contextvars
-import copy
 import os
 import traceback
-import xml.etree.ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, as_completed
 from datetime import datetime
 from enum import Enum
 from io import BytesIO
 from typing import Optional
-import math
+import re
+import threading
+from xml.sax.saxutils import unescape
 
 from aws_lambda_powertools import Tracer
 from helperlayer import HotelFREConfig, ItiliteBaseException, datetime_format_converter, application_constants
 from app.services.hotelxmlconnector.hotel_vendor_request.hotel import HotelVendorRequestPayload
 from app.services.hotelxmlconnector.hotel_vendor_request.vendor.desiya import DesiyaHotels
 from app.services.hotelxmlconnector.hotel_vendor_request.vendor.gds import GDSHotels
-from kafkaconnector import KafkaConnector
-from app.services.hotelxmlconnector.logger import OpensearchLogger
 from lxml import etree
 from app.services.hotelxmlconnector.mongo_util import mongo_obj
 from opensearchlogger.logging import logger
-from s3connector import S3Threading
+from . import archive, capture, message_format, page_index
+from .batch_policy import BatchSizePolicy, summarize_sizes
+from .dedupe import HotelDedupe
+from .extractor import HotelExtractor
+from .producer import DeliveryTracker, get_producer
+from .scheduler import CPU_LANE, PAGE_PREFETCH_LANE, PUBLISH_LANE, VENDOR_IO_LANE, scheduler
+from .streaming import ChunkScan, PageScan
 from .helper import batch_list
 
 
@@ -33,10 +36,14 @@ HOTEL_CHAIN_MEMBERSHIP_DEAL_COLLECTION = os.environ["HOTEL_CHAIN_MEMBERSHIP_DEAL
 TP_UAPI_VERSION = os.environ["TP_UAPI_VERSION"]
 TP_UAPI_WSDL_VERSION = os.environ["TP_UAPI_WSDL_VERSION"]
 
+RESPONSE_PARSE_MODE = os.getenv("HOTEL_RESPONSE_PARSE_MODE", "dom")  # dom or stream
+DESIYA_ROOM_STAY_XPATH = "/x:Envelope/x:Body/y:OTA_HotelAvailRS/y:RoomStays/y:RoomStay"
+# Targeted scan of the raw response, so the next page goes out before the current one is parsed.
+NEXT_PAGE_REFERENCE_PATTERN = re.compile(rb"<(?:[\w.-]+:)?NextResultReference\b[^>]*>([^<]+)</")
+
 MODE = "hotel"
 HOTEL_CHAIN_MEMBERSHIP_DEAL_MAPPING = {}
 tracer = Tracer()
-processed_hotel_ids = {}
 
 Allied_details = application_constants.AlliedDetailsConstants()
 Allied_marriott_hotel_chains = list(Allied_details.ALLIED_MARRIOTT_HOTEL_CHAINS)
@@ -66,6 +73,19 @@ VENDOR_REQUEST_MAPPING = {
         "allow_next_page_until": 15,
         "next_page_cut_off_time": 160,  # In sec
         "required_separate_hotel_details": True,
+        "stream_results": True,
+        "extractor": {
+            "fields": {"hotel_id": "y:HotelProperty/@HotelCode", "hotel_chain": "y:HotelProperty/@HotelChain"},
+            "membership_deals": True,
+        },
+        "batch_size": {
+            "default_size": 5,
+            "min_size": 5,
+            "max_size": 25,
+            "target_bytes": 65536,
+            "target_seconds": 20,  # In sec
+            "seconds_per_hotel": 2,  # In sec
+        },
     },
     "desiya": {
         "connector": DesiyaHotels,
@@ -80,6 +100,19 @@ VENDOR_REQUEST_MAPPING = {
         "allow_next_page_until": 15,
         "next_page_cut_off_time": 160,  # In sec
         "required_separate_hotel_details": True,
+        "stream_results": False,
+        "extractor": {
+            "fields": {"hotel_id": "y:RoomStay/y:BasicPropertyInfo/@HotelCode", "hotel_chain": None},
+            "multiple": True,
+        },
+        "batch_size": {
+            "default_size": 10,
+            "min_size": 10,
+            "max_size": 40,
+            "target_bytes": 65536,
+            "target_seconds": 20,  # In sec
+            "seconds_per_hotel": 1,  # In sec
+        },
     },
     "ALLIED_US_PCC": {
         "connector": GDSHotels,
@@ -95,9 +128,36 @@ VENDOR_REQUEST_MAPPING = {
         "allow_next_page_until": 15,
         "next_page_cut_off_time": 160,  # In sec
         "required_separate_hotel_details": True,
+        "stream_results": True,
+        "extractor": {
+            "fields": {"hotel_id": "y:HotelProperty/@HotelCode", "hotel_chain": "y:HotelProperty/@HotelChain"},
+            "membership_deals": True,
+        },
+        "batch_size": {
+            "default_size": 5,
+            "min_size": 5,
+            "max_size": 25,
+            "target_bytes": 65536,
+            "target_seconds": 20,  # In sec
+            "seconds_per_hotel": 2,  # In sec
+        },
     },
 }
 
+# Compiled once per vendor, the namespaces of the mapping already carry the uAPI version.
+HOTEL_EXTRACTORS = {name: HotelExtractor.from_mapping(mapping) for name, mapping in VENDOR_REQUEST_MAPPING.items()}
+# Shared by the locations of a vendor, so the sizes adapt to everything the process published for it.
+BATCH_SIZE_POLICIES = {name: BatchSizePolicy.from_mapping(mapping) for name, mapping in VENDOR_REQUEST_MAPPING.items()}
+
+
+def parse_page(content):
+    """
+    Parse a raw vendor response
+    :param content: raw response bytes
+    :return: root element
+    """
+    return etree.parse(BytesIO(content)).getroot()
+
 
 def get_membership_deal_code_by_hotel_chain(hotel_chain):
     """
@@ -120,14 +180,6 @@ def get_membership_deal_code_by_hotel_chain(hotel_chain):
         return membership_mapping
 
 
-def _is_hotel_processed(hotel_id):
-    if processed_hotel_ids.get(hotel_id):
-        return True
-    logger.info(f"Ignoring Hotel {hotel_id} as already processed")
-    processed_hotel_ids[hotel_id] = True
-    return False
-
-
 class HotelVendorRequestHandler:
     def __init__(
         self,
@@ -136,15 +188,19 @@ class HotelVendorRequestHandler:
         trip_id: str,
         payload: dict,
         sub_vendor_count: int,
+        hotel_dedupe: Optional[HotelDedupe] = None,
     ):
         self.fre_config = fre_config
         self.trip_id = trip_id
         self.payload = payload
         self.sub_vendor_count = sub_vendor_count
+        # Shared by the grid cells of the leg and vendor request, so overlapping cells publish a hotel once
+        self.hotel_dedupe = hotel_dedupe or HotelDedupe()
 
         # No of hotels
         self.hotel_count = 0
         self.batch_number = 0
+        self.batch_lock = threading.Lock()
 
         if self.fre_config.name not in VENDOR_REQUEST_MAPPING:
             raise NotImplementedError(f"hotel connector mapping is not present for {self.fre_config.name}")
@@ -152,6 +208,7 @@ class HotelVendorRequestHandler:
         request_mapping = VENDOR_REQUEST_MAPPING[self.fre_config.name]
 
         self.request_mapping = request_mapping
+        self.hotel_extractor = HOTEL_EXTRACTORS[self.fre_config.name]
         self.page_data = {"from": 451, "to": 500, "count": 500, "limit": 500}
 
         self.hotel_connector = self.request_mapping["connector"](self.fre_config)
@@ -172,19 +229,23 @@ class HotelVendorRequestHandler:
         self.next_page_count = 1
         self.connector_start_time = datetime.now()
         self.page_ref = False
+        # Set when the vendor had more results than the page or row caps let through, the cell is then worth refining
+        self.result_capped = False
 
         self.raw_xml_response = None
         self.root_xml = None
-        parent_context = contextvars.copy_context()
         self.leg_request_id = self.payload["leg_req_info"]["hotel_request"]["leg_request_id"]
-        self.thread_pool_executor = ThreadPoolExecutor(
-            max_workers=15,
-            initializer=OpensearchLogger.set_context,
-            initargs=(parent_context,),
-        )
+        # Publish and upload tasks of this location, run on the process-wide scheduler
         self.thread_pool_list = []
+        # Publish task of the last page queued, every page publishes after the one before it
+        self.last_publish = None
+        self.publish_lock = threading.Lock()
+        self.hotel_details_producer = get_producer()
+        self.delivery_tracker = DeliveryTracker()
+        self.batch_size_policy = BATCH_SIZE_POLICIES[self.fre_config.name]
+        self.batch_sizes = []
 
-        self.s3 = S3Threading()
+        self.archiver = archive.get_archiver()
 
     @tracer.capture_method(capture_response=False)
     def get_hotels_from_vendor(self):
@@ -194,9 +255,12 @@ class HotelVendorRequestHandler:
                 self.send_request_to_vendor(self.page_data)
             elif self.fre_config.name == ALLIED_VENDOR:
                 batches = list(batch_list(Allied_marriott_hotel_chains, 3))
-                max_workers = math.ceil(len(Allied_marriott_hotel_chains) / 3)
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    executor.map(lambda batch: self.send_request_to_vendor(None, batch), batches)
+                batch_futures = [scheduler.submit(VENDOR_IO_LANE, self.send_request_to_vendor, None, batch) for batch in batches]
+                for batch, batch_future in zip(batches, batch_futures):
+                    try:
+                        scheduler.join(batch_future)
+                    except Exception:
+                        logger.error(f"Allied batch {batch} failed: {traceback.format_exc()}")
             else:
                 self.send_request_to_vendor()
             # self.hotel_connector.disconnect()
@@ -205,7 +269,15 @@ class HotelVendorRequestHandler:
 
             status_code = 200
             status_message = "Vendor fetch is successful"
-            return {"status_code": status_code, "message": status_message, "batches": self.batch_number, "hotels": self.hotel_count}
+            return {
+                "status_code": status_code,
+                "message": status_message,
+                "batches": self.batch_number,
+                "hotels": self.hotel_count,
+                "result_capped": self.result_capped,
+                "delivery": self.flush_hotel_details(),
+                "batch_sizes": summarize_sizes(self.batch_sizes),
+            }
 
         except ItiliteBaseException as itilite_exception:
             logger.error(
@@ -222,30 +294,45 @@ class HotelVendorRequestHandler:
             else:
                 status_code = 200
                 status_message = "Vendor fetch is successful"
-                return {"status_code": status_code, "message": status_message, "batches": self.batch_number}
+                return {
+                    "status_code": status_code,
+                    "message": status_message,
+                    "batches": self.batch_number,
+                    "result_capped": self.result_capped,
+                    "delivery": self.flush_hotel_details(),
+                    "batch_sizes": summarize_sizes(self.batch_sizes),
+                }
 
     @tracer.capture_method(capture_response=False)
     def send_request_to_vendor(self, next_page_reference=None, allowed_marriott_chains: Optional[list] = None):
         if allowed_marriott_chains:
             logger.info(f"Processing batch for marriott: {allowed_marriott_chains}")
-        raw_response, page_limit = self.hotel_connector.get_response(
-            self.hotel_request, next_page_reference, self.leg_request_id, allowed_marriott_chains
-        )
-        if raw_response:
-            if raw_response.status_code != 200:
-                raise ItiliteBaseException(
-                    f" Search call :Got error status code from the vendor while fetching next page"
-                    f" reference:{raw_response.status_code} leg_request_id - {self.leg_request_id} "
-                    f"vendor request id - {self.fre_config.vendor_request_id} "
-                    f"next page refer - {next_page_reference}"
-                )
-            elif self.page_data["to"] != self.page_data["limit"]:
-                self.page_data["from"] = page_limit + 1
-                self.page_data["to"] = self.page_data["from"] + (self.page_data["count"] - 1)
-
+        page = self.fetch_page(next_page_reference, allowed_marriott_chains)
+        while page is not None:
+            raw_response, exchange = page
+            capture.last_exchange.set(exchange)
             self.raw_xml_response = raw_response.content
 
-            self.process_hotel_response()
+            # Send the next page request before processing this one, so it is in flight while this page is saved and published.
+            # It goes to the page prefetch lane, the vendor IO lane is held by the page loops themselves under load. A request
+            # still queued when the loop is done with the page is sent inline by the join.
+            next_page = None
+            next_page_reference = self.scan_next_page_reference(self.raw_xml_response)
+            if next_page_reference:
+                next_page = scheduler.submit(PAGE_PREFETCH_LANE, self.fetch_page, next_page_reference, allowed_marriott_chains)
+            self.page_ref = next_page is None
+
+            try:
+                self.process_hotel_response()
+            except Exception:
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+            if next_page is None:
+                break
+            self.next_page_count += 1
+            page = scheduler.join(next_page)
+
         for future in as_completed(self.thread_pool_list):
             try:
                 future.result()
@@ -254,63 +341,122 @@ class HotelVendorRequestHandler:
                     f"Hotel xml thread failed for one hotel - {itilite_exception.message} traceback - " f"{traceback.format_exc()}"
                 )
 
+    def fetch_page(self, next_page_reference=None, allowed_marriott_chains: Optional[list] = None):
+        """
+        Request one result page from the vendor
+        :param next_page_reference: NextResultReference of the previous page, None for the first page
+        :param allowed_marriott_chains: chains of the allied batch
+        :return: (raw response, captured wire exchange) or None when the vendor returned nothing
+        """
+        capture.last_exchange.set(None)
+        raw_response, page_limit = self.hotel_connector.get_response(
+            self.hotel_request, next_page_reference, self.leg_request_id, allowed_marriott_chains
+        )
+        if not raw_response:
+            return None
+        if raw_response.status_code != 200:
+            raise ItiliteBaseException(
+                f" Search call :Got error status code from the vendor while fetching next page"
+                f" reference:{raw_response.status_code} leg_request_id - {self.leg_request_id} "
+                f"vendor request id - {self.fre_config.vendor_request_id} "
+                f"next page refer - {next_page_reference}"
+            )
+        elif self.page_data["to"] != self.page_data["limit"]:
+            self.page_data["from"] = page_limit + 1
+            self.page_data["to"] = self.page_data["from"] + (self.page_data["count"] - 1)
+        return raw_response, capture.last_exchange.get()
+
+    def scan_next_page_reference(self, content):
+        """
+        Find the NextResultReference in the raw response without parsing it
+        :param content: raw response bytes
+        :return: the reference when a next page is available and allowed, else None
+        """
+        if not self.request_mapping["next_page_reference"]:
+            return None
+        match = NEXT_PAGE_REFERENCE_PATTERN.search(content)
+        next_page_reference = unescape(match.group(1).decode("utf-8")) if match is not None else None
+        if not next_page_reference:
+            return None
+        total_execution_time = datetime.now() - self.connector_start_time
+        if (
+            self.next_page_count >= self.request_mapping.get("allow_next_page_until", 2)
+            or total_execution_time.total_seconds() >= self.request_mapping.get("next_page_cut_off_time", 180)
+        ):
+            # The vendor still has results for this cell
+            self.result_capped = True
+            return None
+        return next_page_reference
+
+    def check_row_limit(self, result_count):
+        """
+        Flag the cell as capped when a page returned as many results as the row limit of the request
+        :param result_count: number of hotel results of the page
+        """
+        if result_count >= self.page_data["limit"]:
+            self.result_capped = True
+
     @tracer.capture_method(capture_response=False)
     def process_hotel_response(self):
-        # Save the response in S3
-        self.root_xml = etree.parse(BytesIO(self.raw_xml_response)).getroot()
+        if RESPONSE_PARSE_MODE == "stream" and self.request_mapping.get("stream_results"):
+            return self.process_hotel_response_stream()
         if self.fre_config.name == "desiya":
-            try:
-                s3_metadata = self.save_to_s3(self.raw_xml_response, 5000)
-                logger.info(f"desiya_search_vendor_response_full_s3====> {s3_metadata}")
-            except Exception:
-                logger.error(traceback.format_exc())
-            self.split_xml_string(self.raw_xml_response)
-        else:
-            s3_metadata = self.save_to_s3(self.raw_xml_response, self.next_page_count)
+            return self.process_desiya_response()
+        # Save the response in S3
+        self.root_xml = scheduler.join(scheduler.submit(CPU_LANE, parse_page, self.raw_xml_response))
+        s3_metadata = self.archive_page(self.raw_xml_response, self.next_page_count)
+        self.archive_request()
 
         self.check_for_error()
 
         # If no error, start sending the hotel to the hotel_details topic (parallel call)
         if self.request_mapping["required_separate_hotel_details"]:
-            # Since we are using threading, we dont want to pass the root_xml reference to this function.
+            # Only the extracted hotel records go to the thread, never the root_xml reference.
             try:
-                if self.fre_config.name != "desiya":
-                    self.thread_pool_list.append(
-                        self.thread_pool_executor.submit(
-                            self.send_to_hotel_details_topic,
-                            copy.deepcopy(self.root_xml),
-                            s3_metadata,
-                        )
-                    )
+                hotel_records = self.hotel_extractor.extract(self.root_xml)
+                self.check_row_limit(len(hotel_records))
+                s3_metadata = self.index_page(s3_metadata, hotel_records, self.raw_xml_response)
+                self.submit_publish(self.send_to_hotel_details_topic, hotel_records, s3_metadata, self.page_ref)
             except Exception:
                 logger.error(traceback.format_exc())
-        if self.fre_config.name == "desiya":
-            self.page_ref = True
-        else:
-            # Check if next page is available. If yes, then send another parallel request
-            next_page_reference = []
-            if self.request_mapping["next_page_reference"]:
-                next_page_reference = self.root_xml.xpath(
-                    self.request_mapping["next_page_reference"],
-                    namespaces=self.request_mapping["namespaces"],
-                )
 
-            current_time = datetime.now()
-            total_execution_time = current_time - self.connector_start_time
-            if (
-                len(next_page_reference) > 0
-                and len(next_page_reference[0].text) > 0
-                and self.next_page_count < self.request_mapping.get("allow_next_page_until", 2)
-                and total_execution_time.total_seconds() < self.request_mapping.get("next_page_cut_off_time", 180)
-            ):
-                self.next_page_count += 1
-                self.send_request_to_vendor(next_page_reference[0].text)
-            else:
-                self.page_ref = True
+    @tracer.capture_method(capture_response=False)
+    def process_desiya_response(self):
+        """
+        The desiya response is parsed once, by the chunk split, which also collects the vendor errors. The full
+        response and the chunks are uploaded on the publish lane.
+        """
+        self.root_xml = None
+        self.thread_pool_list.append(scheduler.submit(PUBLISH_LANE, self.save_full_response, self.raw_xml_response))
+        errors = scheduler.join(scheduler.submit(CPU_LANE, self.split_xml_string, self.raw_xml_response))
+        self.check_for_error(errors)
+
+    @tracer.capture_method(capture_response=False)
+    def process_hotel_response_stream(self):
+        """
+        Single iterparse pass over the page: hotels are extracted as they are parsed and the vendor errors are
+        checked in the same pass, so the page is never held as a whole DOM. Only the hotel records go to the thread.
+        """
+        self.root_xml = None
+        s3_metadata = self.archive_page(self.raw_xml_response, self.next_page_count)
+        self.archive_request()
+
+        page_scan = PageScan(self.raw_xml_response, self.request_mapping)
+        hotel_records = scheduler.join(scheduler.submit(CPU_LANE, self.hotel_extractor.records, page_scan.results()))
+        self.check_for_error(page_scan.errors)
+        self.check_row_limit(len(hotel_records))
+        s3_metadata = self.index_page(s3_metadata, hotel_records, self.raw_xml_response)
+
+        if self.request_mapping["required_separate_hotel_details"]:
+            try:
+                self.submit_publish(self.send_to_hotel_details_topic, hotel_records, s3_metadata, self.page_ref)
+            except Exception:
+                logger.error(traceback.format_exc())
 
     @tracer.capture_method(capture_response=False)
-    def check_for_error(self):
-        error = self.root_xml.xpath(self.request_mapping["error"], namespaces=self.request_mapping["namespaces"])
+    def check_for_error(self, error=None):
+        if error is None:
+            error = self.root_xml.xpath(self.request_mapping["error"], namespaces=self.request_mapping["namespaces"])
 
         if len(error) > 0:
             if self.fre_config.name == "desiya" and self.next_page_count > 1:
@@ -323,10 +469,7 @@ class HotelVendorRequestHandler:
                     and not self.hotel_connector.is_first_page
                 ):
                     # This is duplicate call in case of a complete failure
-                    hotel_search_request = self.hotel_connector.soap_manager.create_message(
-                        "service", **self.hotel_connector.params
-                    )
-                    hotel_search_xml_request = str(ET.tostring(hotel_search_request, encoding="utf8", method="xml"), "utf-8")
+                    hotel_search_xml_request = self.hotel_connector.render_request()
                     logger.info(f"Hotel search request: {hotel_search_xml_request}")
 
                 for error_message in error:
@@ -337,79 +480,137 @@ class HotelVendorRequestHandler:
                         f" page count - {self.next_page_count} "
                     )
 
-    def push_to_s3(self, each_data, xml_resp):
+    def archive_request(self):
+        """Save a sample of the search requests next to their response, from the bytes captured on the wire."""
+        exchange = capture.last_exchange.get()
+        if exchange is None or not capture.is_sampled(capture.WIRE_ARCHIVE_SAMPLE_RATE):
+            return
+        self.thread_pool_list.append(
+            scheduler.submit(PUBLISH_LANE, self.save_request, exchange.request, f"{self.next_page_count}_request")
+        )
+
+    def save_request(self, content, page_count):
+        # A diagnostic sample, failing to store it must not fail the location
         try:
-            s3_metadata = self.s3.save_to_s3(each_data["bucket"], each_data["filename"], each_data["data"])
+            self.save_to_s3(content, page_count)
+        except Exception:
+            logger.error(f"Error while archiving the search request: {traceback.format_exc()}")
+
+    def push_to_s3(self, each_data, xml_resp, is_last_page=False, previous_publish=None):
+        try:
+            s3_metadata = self.archiver.save(each_data["bucket"], each_data["filename"], each_data["data"])
             logger.info(f"desiya_search_vendor_response_split_s3====>  {s3_metadata}")
-            self.send_to_hotel_details_topic(xml_resp, s3_metadata)
+            self.send_to_hotel_details_topic(self.hotel_extractor.extract(xml_resp), s3_metadata, is_last_page, previous_publish)
 
         except Exception:
             logger.error(f"Error in push_to_s3-----  {traceback.format_exc()}")
 
     def split_xml_string(self, xml_string, chunk_size=10):
+        """
+        Cut the RoomStays of a desiya response into chunks of chunk_size in one streaming pass, each chunk is
+        uploaded and published on the publish lane once the next one is cut, so only the final chunk of the last
+        page is published as the last one
+        :param xml_string: raw desiya response
+        :param chunk_size: RoomStays per chunk
+        :return: vendor error elements of the response
+        """
+        chunk_scan = ChunkScan(
+            xml_string, DESIYA_ROOM_STAY_XPATH, self.request_mapping["error"], self.request_mapping["namespaces"], chunk_size
+        )
         try:
-            xpath = "/x:Envelope/x:Body/y:OTA_HotelAvailRS/y:RoomStays/y:RoomStay"
-            parser = etree.XMLParser(remove_blank_text=True)
-            root = etree.parse(BytesIO(xml_string), parser).getroot()
-
-            elements = root.xpath(xpath, namespaces=self.request_mapping["namespaces"])
-            chunk_count = 1
-            count = 0
-            chunk_elements = []
-            s3_metadata_list = []
-            xml_list = []
-            for element in elements:
-                chunk_elements.append(element)
-                count += 1
-
-                if count >= chunk_size:
-                    resp, xml_root = self.get_s3_content(chunk_elements, chunk_count)
-                    s3_metadata_list.append(resp)
-                    xml_list.append(xml_root)
-                    chunk_count += 1
-                    chunk_elements = []
-                    count = 0
-
-            # Write the last chunk
-            if chunk_elements:
-                resp, xml_root = self.get_s3_content(chunk_elements, chunk_count)
-                s3_metadata_list.append(resp)
-                xml_list.append(xml_root)
-
-            for idx, each_data in enumerate(s3_metadata_list):
-                self.thread_pool_list.append(self.thread_pool_executor.submit(self.push_to_s3, each_data, xml_list[idx]))
-            return []
+            chunk = None
+            for chunk_count, (xml_data, chunk_root) in enumerate(chunk_scan.chunks(), start=1):
+                if chunk is not None:
+                    self.submit_publish(self.push_to_s3, *chunk, False)
+                chunk = (self.get_s3_content(xml_data, chunk_count), chunk_root)
+            if chunk is not None:
+                self.submit_publish(self.push_to_s3, *chunk, self.page_ref)
+            self.check_row_limit(chunk_scan.item_count)
+        except etree.XMLSyntaxError:
+            raise
         except Exception:
             logger.error(f"Error in desiya split xml string-----  {traceback.format_exc()}")
-            return []
+        return chunk_scan.errors
+
+    def get_s3_content(self, xml_data, chunk_count):
+        s3_bucket = os.environ.get("HOTEL_S3_BUCKET_NAME")
+        leg_request_id = self.leg_request_id
+        root_folder_date = datetime.now().strftime("%Y_%m_%d")
+        file_path = root_folder_date + "/" + leg_request_id + "/"
+        s3_file_name = file_path + self.fre_config.vendor_request_id + "_" + str(chunk_count) + ".xml"
+        return {"filename": s3_file_name, "bucket": s3_bucket, "data": xml_data}
 
-    def get_s3_content(self, elements, chunk_count):
+    def save_full_response(self, content):
         try:
-            nsmap = self.request_mapping["namespaces"]
-            root_tag = elements[0].getroottree().getroot().tag
-            chunk_root = etree.Element(root_tag, nsmap=nsmap)
-
-            for element in elements:
-                chunk_root.append(element)
-
-            # Serialize the chunk_root to a string
-            xml_data = etree.tostring(chunk_root, pretty_print=True)
-
-            s3_bucket = os.environ.get("HOTEL_S3_BUCKET_NAME")
-            leg_request_id = self.leg_request_id
-            root_folder_date = datetime.now().strftime("%Y_%m_%d")
-            file_path = root_folder_date + "/" + leg_request_id + "/"
-            s3_file_name = file_path + self.fre_config.vendor_request_id + "_" + str(chunk_count) + ".xml"
-            resp = {"filename": s3_file_name, "bucket": s3_bucket, "data": xml_data}
-            root = etree.parse(BytesIO(xml_data)).getroot()
-            return resp, root
+            s3_metadata = self.save_to_s3(content, 5000)
+            logger.info(f"desiya_search_vendor_response_full_s3====> {s3_metadata}")
         except Exception:
-            logger.info(f"error in getting s3 content---- {traceback.format_exc()}")
+            logger.error(traceback.format_exc())
+
+    def archive_page(self, content, page_count):
+        """
+        Upload a page on the archival stage, off the page loop
+        :param content: raw page
+        :param page_count: page number, as for save_to_s3
+        :return: future of the S3 metadata, send_to_hotel_details_topic resolves it before publishing
+        """
+        s3_location = self.page_location(page_count)
+        # Range reads need the page as is
+        compression = "none" if self.is_page_indexed() else None
+        s3_upload = scheduler.submit(PUBLISH_LANE, self.save_to_s3, content, page_count, compression, s3_location)
+        s3_upload.s3_location = s3_location
+        return s3_upload
+
+    def is_page_indexed(self):
+        return page_index.ARCHIVE_PAGE_FORMAT == "indexed" and not self.hotel_extractor.multiple
+
+    def index_page(self, s3_upload, hotel_records, content):
+        """
+        In the indexed page format, write the hotel index sidecar of an archived page once the page is stored
+        :param s3_upload: future of the page upload, from archive_page
+        :param hotel_records: records of the page, in document order
+        :param content: raw page
+        :return: future of the S3 metadata of the page, with the key of its index under hotel_index, or s3_upload
+            as is in the raw page format
+        """
+        if not self.is_page_indexed():
+            return s3_upload
+        return scheduler.submit(PUBLISH_LANE, self.save_page_index, s3_upload, hotel_records, content)
+
+    def save_page_index(self, s3_upload, hotel_records, content):
+        s3_metadata = scheduler.join(s3_upload)
+        s3_bucket, s3_file_name = s3_upload.s3_location
+        index = page_index.build_hotel_index(
+            content, [record.hotel_id for record in hotel_records], self.request_mapping["result"], s3_file_name
+        )
+        if index is None:
+            logger.error(f"Hotel index skipped for {s3_file_name}, its results do not match the {len(hotel_records)} records")
+            return s3_metadata
+        index_key = s3_file_name + page_index.INDEX_SUFFIX
+        self.archiver.save(s3_bucket, index_key, page_index.dumps(index), "none")
+        if isinstance(s3_metadata, dict):
+            s3_metadata = {**s3_metadata, "hotel_index": index_key}
+        return s3_metadata
 
     @tracer.capture_method(capture_response=False)
-    def save_to_s3(self, content, page_count):
+    def save_to_s3(self, content, page_count, compression=None, s3_location=None):
         connector_start_time = datetime.now()
 
+        s3_bucket, s3_file_name = s3_location or self.page_location(page_count)
+        metadata = self.archiver.save(s3_bucket, s3_file_name, content, compression)
+
+        connector_end_time = datetime.now()
+        connector_delta = connector_end_time - connector_start_time
+        logger.info(f"Time taken to finish S3 upload is {connector_delta.total_seconds()}")
+
+        return metadata
+
+    def page_location(self, page_count):
+        """
+        S3 bucket and key of a raw page
+        :param page_count: page number, 5000 for the full desiya response
+        :return: (bucket, key)
+        """
         s3_bucket = os.environ.get("HOTEL_S3_BUCKET_NAME")
         leg_request_id = self.leg_request_id
         root_folder_date = datetime.now().strftime("%Y_%m_%d")
@@ -421,17 +622,12 @@ class HotelVendorRequestHandler:
                 file_path + self.fre_config.vendor_request_id + "_" + str(self.sub_vendor_count) + "_" + str(page_count) + ".xml"
             )
         # s3_file_name = f"{MODE}/{str(self.trip_id)}/{str(self.fre_config.vendor_request_id)}_{page_count}.xml"
-        metadata = self.s3.save_to_s3(s3_bucket, s3_file_name, content)
-
-        connector_end_time = datetime.now()
-        connector_delta = connector_end_time - connector_start_time
-        logger.info(f"Time taken to finish S3 upload is {connector_delta.total_seconds()}")
-
-        return metadata
+        return s3_bucket, s3_file_name
 
     @tracer.capture_method(capture_response=False)
-    def publish_to_topic(self, hotel_list, s3_metadata):
-        # todo: rewrite this fun a lot of duplicate code
+    def publish_to_topic(self, hotel_list, s3_metadata, is_last_page=None):
+        if is_last_page is None:
+            is_last_page = self.page_ref
         leg_request_id = self.leg_request_id
 
         messages = {
@@ -439,108 +635,121 @@ class HotelVendorRequestHandler:
             "kafka_topic": os.getenv("KAFKA_HOTEL_DETAILS_TOPIC"),
             "kafka_key": str(leg_request_id) + str(self.fre_config.vendor_id),
         }
-        group_size = 5
         self.hotel_count += len(hotel_list)
-        if self.fre_config.name == "desiya":
-            group_size = 10
-        if not self.page_ref:
-            # todo: verify if total_batches calculation is correct
-            for i in range(0, len(hotel_list), group_size):
-                batch_data = {
-                    "request_payload": self.payload,
-                    "hotel_data": hotel_list[i : i + group_size],
-                    "batch_num": self.batch_number,
-                    "s3_metadata": s3_metadata,
-                    "total_batches": 0,
-                    "published_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                }
+        hotel_batches = self.batch_size_policy.split(hotel_list)
+        for index, hotel_batch in enumerate(hotel_batches):
+            with self.batch_lock:
+                batch_num = self.batch_number
                 self.batch_number += 1
-                messages["batch_data"] = batch_data
-                KafkaConnector().produce(messages, is_parallel_push=True)
-                check_connector_end_time = datetime.now()
-                logger.info(
-                    "Time taken to push particular page hotels to xml details - "
-                    + str((check_connector_end_time - self.connector_start_time).total_seconds())
-                )
-                self.connector_start_time = datetime.now()
-        else:
-            for i in range(0, len(hotel_list), group_size):
-                total_batches = 0
-                if i + group_size >= len(hotel_list):
-                    total_batches = self.batch_number
-                batch_data = {
-                    "request_payload": self.payload,
-                    "hotel_data": hotel_list[i : i + group_size],
-                    "batch_num": self.batch_number,
-                    "s3_metadata": s3_metadata,
-                    "total_batches": total_batches,
-                    "published_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                self.batch_number += 1
-                messages["batch_data"] = batch_data
-                KafkaConnector().produce(messages, is_parallel_push=True)
-                check_connector_end_time = datetime.now()
-                logger.info(
-                    "Time taken to push particular page hotels to xml details - "
-                    + str((check_connector_end_time - self.connector_start_time).total_seconds())
-                )
-                self.connector_start_time = datetime.now()
+            # The last batch of the last page carries its batch_num as the total, the consumer waits for it to close
+            # the leg. Pages publish in order (submit_publish), so every other batch is numbered before it.
+            total_batches = batch_num if is_last_page and index == len(hotel_batches) - 1 else 0
+            batch_data = {
+                "request_payload": self.payload,
+                "hotel_data": hotel_batch,
+                "batch_num": batch_num,
+                "s3_metadata": s3_metadata,
+                "total_batches": total_batches,
+                "published_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.batch_sizes.append(len(hotel_batch))
+            messages["batch_data"] = message_format.build_batch(batch_data)
+            message_bytes = self.hotel_details_producer.produce(messages, self.delivery_tracker)
+            self.batch_size_policy.observe_message(message_bytes, len(hotel_batch))
+            check_connector_end_time = datetime.now()
+            logger.info(
+                "Time taken to push particular page hotels to xml details - "
+                + str((check_connector_end_time - self.connector_start_time).total_seconds())
+            )
+            self.connector_start_time = datetime.now()
+
+    def flush_hotel_details(self):
+        """
+        Wait for the delivery of the batches published for this location and log the failed ones
+        :return: dict with the delivered, failed and pending batch counts
+        """
+        delivery = self.hotel_details_producer.flush(self.delivery_tracker)
+        for failure in self.delivery_tracker.failures():
+            logger.error(
+                f"Search call - batch {failure.batch_num} was not delivered to {failure.topic}: {failure.error}"
+                f" leg_request_id - {self.leg_request_id} vendor request id - {self.fre_config.vendor_request_id}"
+            )
+        if delivery["pending"]:
+            logger.error(f"Search call - {delivery['pending']} batches still undelivered after the flush timeout")
+        return delivery
+
+    def submit_publish(self, publish, *args):
+        """
+        Queue the publish task of a page on the publish lane, behind the publish task of the previous page. The
+        task is given that future as previous_publish and waits for it right before producing, so the pages of the
+        location reach the topic in page order whichever of their uploads completes first.
+        :param publish: send_to_hotel_details_topic or push_to_s3
+        :param args: arguments of publish
+        """
+        with self.publish_lock:
+            self.last_publish = scheduler.submit(PUBLISH_LANE, publish, *args, previous_publish=self.last_publish)
+            self.thread_pool_list.append(self.last_publish)
+
+    def wait_for_previous_publish(self, previous_publish):
+        if previous_publish is None:
+            return
+        try:
+            scheduler.join(previous_publish)
+        except Exception:
+            # Logged by the page it belongs to, its failure must not hold back the next pages
+            pass
 
     @tracer.capture_method(capture_response=False)
-    def send_to_hotel_details_topic(self, root, s3_metadata):
+    def send_to_hotel_details_topic(self, hotel_records, s3_metadata, is_last_page=None, previous_publish=None):
+        hotel_list = []
         try:
-            hotel_list = []
-            hotel_result_xml = root.xpath(
-                self.request_mapping["result"],
-                namespaces=self.request_mapping["namespaces"],
-            )
-
-            total_hotel = len(hotel_result_xml)
-            logger.info(f"Total no of hotels found: {str(total_hotel)}")
-
-            for hotel in hotel_result_xml:
-                data = {}
-                if self.fre_config.name == "gds" or self.fre_config.name == ALLIED_VENDOR:
-                    hotel_id = hotel.xpath(
-                        "y:HotelProperty/@HotelCode",
-                        namespaces=self.request_mapping["namespaces"],
-                    )[0]
-                    if _is_hotel_processed(hotel_id):
-                        continue
-                    data["hotel_id"] = hotel_id
-                    hotel_chain = hotel.xpath(
-                        "y:HotelProperty/@HotelChain",
-                        namespaces=self.request_mapping["namespaces"],
-                    )[0]
-                    if self.fre_config.name == ALLIED_VENDOR and hotel_chain not in Allied_marriott_hotel_chains:
-                        logger.info(f"skipped chain {hotel_chain}, not a marriott chain")
-                        continue
-                    data["hotel_chain"] = hotel_chain
-                    data["membership_deal_mapping"] = get_membership_deal_code_by_hotel_chain(hotel_chain)
-                    hotel_list.append(data)
-                elif self.fre_config.name == "desiya":
-                    hotel_ids = hotel.xpath(
-                        "y:RoomStay/y:BasicPropertyInfo/@HotelCode",
-                        namespaces=self.request_mapping["namespaces"],
-                    )
-                    hotel_ids = list(set(hotel_ids))
-                    each_data = {}
-                    for each_id in hotel_ids:
-                        if _is_hotel_processed(each_id):
-                            continue
-                        each_data = {"hotel_id": each_id, "hotel_chain": None}
-                        hotel_list.append(each_data)
+            if isinstance(s3_metadata, Future):
+                # Only published once the page is durable in S3
+                s3_metadata = scheduler.join(s3_metadata)
+            logger.info(f"Total no of hotels found: {str(len(hotel_records))}")
+            hotel_list = self.collect_hotels(hotel_records)
             logger.info(f"Total no of hotel in hotel list {len(hotel_list)}")
-            self.publish_to_topic(hotel_list, s3_metadata)
+            self.wait_for_previous_publish(previous_publish)
+            self.publish_to_topic(hotel_list, s3_metadata, is_last_page)
         except Exception as general_exception:
-            logger.error(
-                f"Search call - Error in sending the hotels to topic in thread: {general_exception}"
-                f" leg_request_id - {self.leg_request_id} vendor request id - "
-                f"{self.fre_config.vendor_request_id} hotel_list - {hotel_list} "
-            )
-            raise ItiliteBaseException(
-                f"Search call - Error in sending the hotels to topic in thread: "
-                f"{general_exception} leg_request_id - {self.leg_request_id} "
-                f"vendor request id - {self.fre_config.vendor_request_id}"
-                f" hotel_list - {hotel_list} "
-            ) from general_exception
+            self._raise_publish_error(general_exception, hotel_list)
+
+    def collect_hotels(self, hotel_records):
+        """
+        Build the hotels to publish from the extracted records, skipping the ones without hotel id and the already
+        processed ones
+        :param hotel_records: records from the vendor's HotelExtractor
+        :return: list of hotel dicts
+        """
+        hotel_list = []
+        for record in hotel_records:
+            if not record.hotel_id:
+                logger.info(
+                    f"Ignoring a hotel of chain {record.hotel_chain} without hotel id leg_request_id - {self.leg_request_id}"
+                    f" vendor request id - {self.fre_config.vendor_request_id}"
+                )
+                continue
+            if self.hotel_dedupe.is_processed(record.hotel_id):
+                logger.info(f"Ignoring Hotel {record.hotel_id} as already processed")
+                continue
+            if self.fre_config.name == ALLIED_VENDOR and record.hotel_chain not in Allied_marriott_hotel_chains:
+                logger.info(f"skipped chain {record.hotel_chain}, not a marriott chain")
+                continue
+            data = {"hotel_id": record.hotel_id, "hotel_chain": record.hotel_chain}
+            if self.hotel_extractor.membership_deals:
+                data["membership_deal_mapping"] = get_membership_deal_code_by_hotel_chain(record.hotel_chain)
+            hotel_list.append(data)
+        return hotel_list
+
+    def _raise_publish_error(self, general_exception, hotel_list):
+        logger.error(
+            f"Search call - Error in sending the hotels to topic in thread: {general_exception}"
+            f" leg_request_id - {self.leg_request_id} vendor request id - "
+            f"{self.fre_config.vendor_request_id} hotel_list - {hotel_list} "
+        )
+        raise ItiliteBaseException(
+            f"Search call - Error in sending the hotels to topic in thread: "
+            f"{general_exception} leg_request_id - {self.leg_request_id} "
+            f"vendor request id - {self.fre_config.vendor_request_id}"
+            f" hotel_list - {hotel_list} "
+        ) from general_exception
@@ -0,0 +1,88 @@
+import hashlib
+import math
+import os
+import threading
+
+DEDUPE_EXACT_LIMIT = int(os.getenv("HOTEL_DEDUPE_EXACT_LIMIT", 50000))  # Hotel ids kept in a set before switching to a Bloom filter
+DEDUPE_BLOOM_CAPACITY = int(os.getenv("HOTEL_DEDUPE_BLOOM_CAPACITY", 1000000))  # Hotel ids the Bloom filter is sized for
+DEDUPE_FALSE_POSITIVE_RATE = float(os.getenv("HOTEL_DEDUPE_FALSE_POSITIVE_RATE", 0.001))
+
+
+class BloomFilter:
+    """Fixed size Bloom filter over strings, using double hashing of one blake2b digest."""
+
+    def __init__(self, capacity, false_positive_rate):
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, value):
+        """Add value, returns True if it was (probably) present already."""
+        present = True
+        for position in self._positions(value):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                present = False
+                self.bits[byte] |= mask
+        return present
+
+
+class HotelDedupe:
+    """
+    Hotel ids already published for one leg and vendor request, shared by all grid cells and pages of it.
+
+    Ids are kept exactly up to exact_limit, then moved into a Bloom filter so memory stays bounded whatever
+    the number of cells and pages. Past that point a new hotel is dropped as a duplicate with a probability of
+    false_positive_rate. Safe for concurrent callers.
+    """
+
+    def __init__(self, exact_limit=DEDUPE_EXACT_LIMIT, bloom_capacity=DEDUPE_BLOOM_CAPACITY, false_positive_rate=DEDUPE_FALSE_POSITIVE_RATE):
+        self.exact_limit = exact_limit
+        self.bloom_capacity = bloom_capacity
+        self.false_positive_rate = false_positive_rate
+        self._lock = threading.Lock()
+        self._exact = set()
+        self._bloom = None
+        self.unique = 0
+        self.duplicates = 0
+
+    def is_processed(self, hotel_id):
+        """
+        Mark hotel_id as processed
+        :param hotel_id: vendor hotel code
+        :return: True if the hotel was already processed for this leg and vendor request
+        """
+        with self._lock:
+            if self._bloom is not None:
+                seen = self._bloom.add(hotel_id)
+            else:
+                seen = hotel_id in self._exact
+                if not seen:
+                    self._exact.add(hotel_id)
+                    if len(self._exact) > self.exact_limit:
+                        self._switch_to_bloom()
+            if seen:
+                self.duplicates += 1
+            else:
+                self.unique += 1
+            return seen
+
+    def metrics(self):
+        """Snapshot of the dedupe counters."""
+        with self._lock:
+            return {
+                "unique_hotels": self.unique,
+                "duplicate_hotels": self.duplicates,
+                "dedupe_mode": "bloom" if self._bloom is not None else "exact",
+            }
+
+    def _switch_to_bloom(self):
+        self._bloom = BloomFilter(self.bloom_capacity, self.false_positive_rate)
+        for hotel_id in self._exact:
+            self._bloom.add(hotel_id)
+        self._exact = set()
@@ -0,0 +1,224 @@
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from lxml import etree
+
+from . import lat_long_grid_derivation
+
+DENSITY_INDEX_PATH = os.getenv("HOTEL_DENSITY_INDEX_PATH", "")  # sqlite file built by this module, empty disables it
+DENSITY_GEOHASH_PRECISION = int(os.getenv("HOTEL_DENSITY_GEOHASH_PRECISION", 5))  # ~4.9 x 4.9 km cells
+DENSITY_HOTELS_PER_CALL = int(os.getenv("HOTEL_DENSITY_HOTELS_PER_CALL", 300))  # Hotels one vendor call returns before it is capped
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude, longitude, precision=DENSITY_GEOHASH_PRECISION):
+    """Geohash of the point, with precision characters."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision=DENSITY_GEOHASH_PRECISION):
+    """(latitude, longitude) size in degrees of the cells of the precision."""
+    lng_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def geohash_center(geohash):
+    """(latitude, longitude) of the centre of the geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+
+def geohashes_in_radius(latitude, longitude, radius, precision=DENSITY_GEOHASH_PRECISION):
+    """Geohash cells whose centre lies within radius kilometers of the point, with their centres."""
+    lat_size, lng_size = geohash_cell_size(precision)
+    lat_span = radius / 111 + lat_size
+    lng_span = lat_span / max(0.01, abs(math.cos(math.radians(latitude))))
+    cells = {}
+    lat = latitude - lat_span
+    while lat <= latitude + lat_span:
+        lng = longitude - lng_span
+        while lng <= longitude + lng_span:
+            geohash = geohash_encode(lat, (lng + 540) % 360 - 180, precision)
+            if geohash not in cells:
+                center = geohash_center(geohash)
+                if lat_long_grid_derivation.haversine_km(latitude, longitude, *center) <= radius:
+                    cells[geohash] = center
+            lng += lng_size
+        lat += lat_size
+    return cells
+
+
+class DensityIndex:
+    """
+    Read-only lookup of the historical hotel counts per geohash cell and vendor.
+
+    The index is a sqlite file with one row per (vendor, geohash), opened once per process in immutable mode,
+    so loading it costs a file open and every lookup is an indexed query of the cells around the search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?immutable=1", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._connection.execute("SELECT key, value FROM index_meta").fetchall())
+        self.precision = int(meta["precision"])
+        self.built_at = meta.get("built_at")
+
+    @classmethod
+    def load(cls, path=DENSITY_INDEX_PATH):
+        """
+        Open the index when one is configured and present
+        :param path: sqlite file of the index
+        :return: DensityIndex or None
+        """
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def hotel_counts(self, vendor, latitude, longitude, radius):
+        """
+        Historical hotel counts of the cells around a search
+        :param vendor: vendor name, as in VENDOR_REQUEST_MAPPING
+        :param latitude: search latitude
+        :param longitude: search longitude
+        :param radius: search radius in km
+        :return: list of (latitude, longitude, hotels) of the cell centres within radius that have hotels
+        """
+        cells = geohashes_in_radius(latitude, longitude, radius, self.precision)
+        if not cells:
+            return []
+        geohashes = list(cells)
+        query = f"SELECT geohash, hotels FROM hotel_density WHERE vendor = ? AND geohash IN ({','.join('?' * len(geohashes))})"
+        with self._lock:
+            rows = self._connection.execute(query, [vendor, *geohashes]).fetchall()
+        return [(*cells[geohash], hotels) for geohash, hotels in rows]
+
+    def choose_depth(self, vendor, latitude, longitude, radius, max_depth, hotels_per_call=DENSITY_HOTELS_PER_CALL):
+        """
+        Smallest grid depth whose busiest circle is expected to stay under the vendor cap
+        :param vendor: vendor name
+        :param latitude: search latitude
+        :param longitude: search longitude
+        :param radius: search radius in km
+        :param max_depth: deepest level allowed for the vendor
+        :param hotels_per_call: hotels one call returns before it is capped
+        :return: depth between 0 and max_depth, or None when the index knows no hotel around the search
+        """
+        counts = self.hotel_counts(vendor, latitude, longitude, radius)
+        if not counts:
+            return None
+        for depth in range(max_depth + 1):
+            plan = lat_long_grid_derivation.plan_coverage(latitude, longitude, radius, depth)
+            busiest = max(
+                sum(
+                    hotels
+                    for cell_lat, cell_lng, hotels in counts
+                    if lat_long_grid_derivation.haversine_km(lat, lng, cell_lat, cell_lng) <= cell_radius
+                )
+                for lat, lng, cell_radius in plan
+            )
+            if busiest <= hotels_per_call:
+                return depth
+        return max_depth
+
+
+def _page_hotels(path):
+    """(hotel code, latitude, longitude) of the hotels of one archived GDS search page, any uAPI version."""
+    hotels = []
+    for _, hotel in etree.iterparse(path, events=("end",), tag="{*}HotelProperty", huge_tree=True):
+        coordinate = hotel.find("{*}CoordinateLocation")
+        if coordinate is not None:
+            hotels.append((str(hotel.get("HotelCode")), float(coordinate.get("latitude")), float(coordinate.get("longitude"))))
+        hotel.clear(keep_tail=True)
+    return hotels
+
+
+def build_index(output_path, vendor, page_paths, precision=DENSITY_GEOHASH_PRECISION):
+    """
+    Build or extend the index from archived search pages.
+
+    The pages are the per page XMLs save_to_s3 writes under YYYY_MM_DD/leg_request_id/, synced locally first
+    (e.g. aws s3 sync). Every hotel is counted once per vendor, in the cell of its own coordinates, so the
+    overlapping circles and pages of the archive do not inflate the counts.
+
+    Parameters:
+    - output_path: sqlite file to write
+    - vendor: vendor name the pages belong to
+    - page_paths: archived page XML files
+    - precision: geohash precision of the cells
+
+    Returns:
+    - dict with the pages read, the unique hotels and the cells of the vendor
+    """
+    connection = sqlite3.connect(output_path)
+    connection.executescript(
+        "CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT);"
+        "CREATE TABLE IF NOT EXISTS hotel_location (vendor TEXT, hotel_id TEXT, geohash TEXT, PRIMARY KEY (vendor, hotel_id));"
+        "CREATE TABLE IF NOT EXISTS hotel_density (vendor TEXT, geohash TEXT, hotels INTEGER, PRIMARY KEY (vendor, geohash))"
+        " WITHOUT ROWID;"
+    )
+    meta = dict(connection.execute("SELECT key, value FROM index_meta").fetchall())
+    if int(meta.get("precision", precision)) != precision:
+        raise ValueError(f"index {output_path} was built with geohash precision {meta['precision']}")
+
+    pages = 0
+    for path in page_paths:
+        try:
+            hotels = _page_hotels(path)
+        except etree.XMLSyntaxError:
+            continue
+        pages += 1
+        connection.executemany(
+            "INSERT OR IGNORE INTO hotel_location VALUES (?, ?, ?)",
+            [(vendor, hotel_id, geohash_encode(lat, lng, precision)) for hotel_id, lat, lng in hotels],
+        )
+    connection.execute("DELETE FROM hotel_density WHERE vendor = ?", (vendor,))
+    connection.execute(
+        "INSERT INTO hotel_density SELECT vendor, geohash, COUNT(*) FROM hotel_location WHERE vendor = ? GROUP BY geohash",
+        (vendor,),
+    )
+    connection.executemany(
+        "INSERT OR REPLACE INTO index_meta VALUES (?, ?)",
+        [("precision", str(precision)), ("built_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))],
+    )
+    connection.commit()
+    summary = {
+        "pages": pages,
+        "hotels": connection.execute("SELECT COUNT(*) FROM hotel_location WHERE vendor = ?", (vendor,)).fetchone()[0],
+        "cells": connection.execute("SELECT COUNT(*) FROM hotel_density WHERE vendor = ?", (vendor,)).fetchone()[0],
+    }
+    connection.execute("VACUUM")
+    connection.close()
+    return summary
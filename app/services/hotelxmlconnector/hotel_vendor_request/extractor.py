@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+from lxml import etree
+
+
+class HotelExtractor:
+    """
+    Compiled form of the "extractor" spec of a vendor in VENDOR_REQUEST_MAPPING.
+
+    The result and field xpaths are compiled once into etree.XPath objects, and every hotel comes out as a
+    namedtuple record holding plain strings. The records carry no reference to the parsed page, so they are
+    the only thing handed to the details threads.
+
+    Spec keys:
+    - fields: record field -> xpath relative to a result element, or None for a field the vendor does not have
+    - multiple: a result element holds several hotels (desiya chunks), field xpaths then return one value per hotel
+    - membership_deals: whether the hotel chain membership deals are looked up for the vendor's hotels
+    """
+
+    def __init__(self, result, namespaces, fields, multiple=False, membership_deals=False):
+        self.record_type = namedtuple("HotelRecord", list(fields))
+        self.result = etree.XPath(result, namespaces=namespaces)
+        self.fields = [
+            etree.XPath(path, namespaces=namespaces, smart_strings=False) if path is not None else None for path in fields.values()
+        ]
+        self.multiple = multiple
+        self.membership_deals = membership_deals
+
+    @classmethod
+    def from_mapping(cls, request_mapping):
+        """
+        Compile the extractor of a VENDOR_REQUEST_MAPPING entry
+        :param request_mapping: vendor entry, with the result xpath, namespaces and extractor spec
+        :return: HotelExtractor
+        """
+        return cls(request_mapping["result"], request_mapping["namespaces"], **request_mapping["extractor"])
+
+    def records(self, hotel_results):
+        """
+        Hotel records of the result elements, in document order
+        :param hotel_results: iterable of result elements, e.g. PageScan.results() or the result xpath of a page
+        :return: list of records
+        """
+        records = []
+        for hotel in hotel_results:
+            values = [field(hotel) if field is not None else None for field in self.fields]
+            if self.multiple:
+                count = max((len(value) for value in values if value is not None), default=0)
+                columns = [value if value is not None else [None] * count for value in values]
+                # A hotel repeated inside the same result element is one record
+                records.extend(self.record_type(*row) for row in dict.fromkeys(zip(*columns)))
+            else:
+                records.append(self.record_type(*(value[0] if value else None for value in values)))
+        return records
+
+    def extract(self, root):
+        """
+        Hotel records of a parsed page
+        :param root: root element of the vendor response
+        :return: list of records
+        """
+        return self.records(self.result(root))
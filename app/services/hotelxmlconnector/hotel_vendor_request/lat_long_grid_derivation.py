@@ -1,12 +1,62 @@
 # mypy: ignore-errors
+import functools
+import math
+
+import numpy as np
 from geopy.distance import geodesic
 
+EARTH_RADIUS_KM = 6371.0088
+GRID_DIVISION_FACTOR = 2  # Factor by which to divide the radius to create smaller grids
+PHASE_STEPS = 3  # Lattice offsets tried per axis by the coverage planner
+ROTATION_STEPS = 2  # Lattice rotations tried within the 60 degree symmetry of the hexagon
+SAMPLES_PER_CELL_RADIUS = 10  # Density of the points the planner checks coverage on
+# Spherical distances within this share of the radius are re-checked with geodesic, the ellipsoid differs by < 0.6%
+GEODESIC_RECHECK_BAND = 0.01
+
+
+@functools.lru_cache(maxsize=256)
+def _hex_grid_offsets(large_radius_km, small_radius_km):
+    """
+    Degree offsets of every candidate point of the hexagonal grid, in row-major order, independent of the centre.
+
+    Returns:
+    - (lat offsets, long offsets, odd row mask, half column width) as read-only arrays and float
+    """
+    # Convert radius from kilometers to degrees (approximate)
+    small_radius_deg = small_radius_km / 111
+    row_height = small_radius_deg * 1.5
+    col_width = small_radius_deg * (3**0.5)
+
+    # Estimate the number of rows and columns needed
+    num_rows = int((large_radius_km * 2 / (small_radius_km * 1.5))) + 2
+    num_cols = int((large_radius_km * 2 / (small_radius_km * (3**0.5)))) + 2
+
+    rows, cols = np.meshgrid(np.arange(num_rows), np.arange(num_cols), indexing="ij")
+    lat_offsets = ((rows - num_rows // 2) * row_height).ravel()
+    long_offsets = ((cols - num_cols // 2) * col_width).ravel()
+    odd_rows = (rows % 2 == 1).ravel()
+    for array in (lat_offsets, long_offsets, odd_rows):
+        array.flags.writeable = False
+    return lat_offsets, long_offsets, odd_rows, col_width / 2
+
+
+def haversine_km_array(lat, lng, lats, lngs):
+    """Great-circle distances in kilometers from (lat, lng) to every point of the lats/lngs arrays."""
+    lat_rad, lats_rad = np.radians(lat), np.radians(lats)
+    a = np.sin((lats_rad - lat_rad) / 2) ** 2 + np.cos(lat_rad) * np.cos(lats_rad) * np.sin(np.radians(lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
 
 def generate_hexagonal_grid(lat, long, large_radius_km, small_radius_km):
     """
     Generate a list of latitude and longitude coordinates arranged in a hexagonal grid
     around a central point.
 
+    The candidate offsets are memoised per radius pair and translated to the centre, and their distances are
+    computed in one array operation. Only the candidates close to the edge of the large circle, where the sphere
+    and the ellipsoid may disagree, are re-checked with geodesic, so the output is the same as a geodesic check
+    of every point.
+
     Parameters:
     - lat: Central latitude
     - long: Central longitude
@@ -16,33 +66,37 @@ def generate_hexagonal_grid(lat, long, large_radius_km, small_radius_km):
     Returns:
     - List of [latitude, longitude] pairs
     """
-    # Convert radius from kilometers to degrees (approximate)
+    lat_offsets, long_offsets, odd_rows, half_col_width = _hex_grid_offsets(large_radius_km, small_radius_km)
+    offset_lats = lat + lat_offsets
+    offset_longs = long + long_offsets
+    offset_longs[odd_rows] += half_col_width
+
+    # Check if the offset points are within the large circle radius
+    distances = haversine_km_array(lat, long, offset_lats, offset_longs)
+    inside = distances <= large_radius_km
+    for index in np.flatnonzero(np.abs(distances - large_radius_km) <= large_radius_km * GEODESIC_RECHECK_BAND):
+        inside[index] = geodesic((lat, long), (offset_lats[index], offset_longs[index])).km <= large_radius_km
+
+    return [[float(offset_lat), float(offset_long)] for offset_lat, offset_long in zip(offset_lats[inside], offset_longs[inside])]
+
+
+def _generate_hexagonal_grid_scalar(lat, long, large_radius_km, small_radius_km):
+    """Point by point geodesic version of generate_hexagonal_grid, kept as the reference the vectorised grid is tested against."""
     small_radius_deg = small_radius_km / 111
     row_height = small_radius_deg * 1.5
     col_width = small_radius_deg * (3**0.5)
-
-    # num_rows = int((large_radius_km / small_radius_km) * 1.5) * 2 + 1
-    # num_cols = int((large_radius_km / small_radius_km) * (3 ** 0.5)) * 2 + 1
-
-    # Estimate the number of rows and columns needed
     num_rows = int((large_radius_km * 2 / (small_radius_km * 1.5))) + 2
     num_cols = int((large_radius_km * 2 / (small_radius_km * (3**0.5)))) + 2
 
     all_lat_long = []
-
     for row in range(num_rows):
         for col in range(num_cols):
             offset_lat = lat + (row - num_rows // 2) * row_height
             offset_long = long + (col - num_cols // 2) * col_width
-
             if row % 2 == 1:
                 offset_long += col_width / 2
-
-            # Check if the offset point is within the large circle radius
-            # if geodesic((lat, long), (offset_lat, offset_long)).km <= large_radius_km + small_radius_km:
             if geodesic((lat, long), (offset_lat, offset_long)).km <= large_radius_km:
                 all_lat_long.append([offset_lat, offset_long])
-
     return all_lat_long
 
 
@@ -108,23 +162,239 @@ def get_equivalent_smaller_grids(latitude, longitude, radius, depth_degree=1):
       where each location represents a smaller grid location at each division level.
     """
 
-    GRID_DIVISION_FACTOR = 2  # Factor by which to divide the radius to create smaller grids
     smaller_radius = radius
-    locations = [(latitude, longitude, radius)]  # List to hold the central location and smaller grid locations
+    # List to hold the central location and smaller grid locations
+    locations = [(latitude, longitude, radius)] if depth_degree <= 0 else []
 
     while depth_degree > 0:
         depth_degree -= 1
-        central_grid_location = (latitude, longitude, smaller_radius)
-        locations.remove(central_grid_location)  # Remove the central location from the list of locations
         # Generate the smaller grid based on the new radius
         inner_hex_grid = generate_hexagonal_grid(latitude, longitude, smaller_radius, smaller_radius / GRID_DIVISION_FACTOR)
         smaller_radius /= GRID_DIVISION_FACTOR  # Reduce the radius for the next level of grids
-        # Add the new smaller grid locations to the list
-        locations.extend([(lat, lng, smaller_radius) for lat, lng in inner_hex_grid])
+        # The central location is divided again by the next level, so it is left out here instead of removed later
+        locations.extend(
+            [(lat, lng, smaller_radius) for lat, lng in inner_hex_grid if depth_degree == 0 or (lat, lng) != (latitude, longitude)]
+        )
+
+    return locations
+
+
+def destination_point(lat, lng, bearing, distance_km):
+    """
+    Point reached from (lat, lng) after distance_km along the initial bearing (radians), on a spherical earth.
+
+    Returns:
+    - (latitude, longitude) in decimal degrees
+    """
+    angular_distance = distance_km / EARTH_RADIUS_KM
+    lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+    dest_lat = math.asin(
+        math.sin(lat_rad) * math.cos(angular_distance) + math.cos(lat_rad) * math.sin(angular_distance) * math.cos(bearing)
+    )
+    dest_lng = lng_rad + math.atan2(
+        math.sin(bearing) * math.sin(angular_distance) * math.cos(lat_rad),
+        math.cos(angular_distance) - math.sin(lat_rad) * math.sin(dest_lat),
+    )
+    return math.degrees(dest_lat), (math.degrees(dest_lng) + 540) % 360 - 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometers between two points on a spherical earth."""
+    d_lat, d_lng = math.radians(lat2 - lat1), math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _point_segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
 
+
+def _hex_lattice_cells(outer_radius, inner_radius, cell_radius, offset, rotation):
+    """
+    Centers (km east, km north of the search centre) of the hexagonal lattice cells intersecting the annulus
+    inner_radius..outer_radius. The lattice spacing is sqrt(3) * cell_radius, so every hexagonal cell lies inside
+    the circle of cell_radius around its centre and the circles cover whatever their cells cover.
+    """
+    spacing = math.sqrt(3) * cell_radius
+    circumradius = cell_radius
+    cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+    # Lattice basis (spacing, 0) and (spacing / 2, spacing * sqrt(3) / 2), rotated
+    basis_u = (spacing * cos_r, spacing * sin_r)
+    basis_v = (spacing * (0.5 * cos_r - math.sqrt(3) / 2 * sin_r), spacing * (0.5 * sin_r + math.sqrt(3) / 2 * cos_r))
+    vertex_angles = [rotation + math.pi / 6 + k * math.pi / 3 for k in range(6)]
+
+    extent = int(math.ceil((outer_radius + circumradius) / (spacing * math.sqrt(3) / 2))) + 1
+    cells = []
+    for i in range(-extent, extent + 1):
+        for j in range(-extent, extent + 1):
+            x = offset[0] + i * basis_u[0] + j * basis_v[0]
+            y = offset[1] + i * basis_u[1] + j * basis_v[1]
+            if math.hypot(x, y) > outer_radius + circumradius:
+                continue
+            vertices = [(x + circumradius * math.cos(a), y + circumradius * math.sin(a)) for a in vertex_angles]
+            if max(math.hypot(vx, vy) for vx, vy in vertices) <= inner_radius:
+                continue  # Cell entirely inside the inner disc, covered by the finer level
+            inside = math.hypot(x, y) <= outer_radius
+            if not inside:
+                nearest = min(
+                    _point_segment_distance(0.0, 0.0, *vertices[k], *vertices[(k + 1) % 6]) for k in range(6)
+                )
+                if nearest > outer_radius:
+                    continue
+            cells.append((x, y))
+    return cells
+
+
+def _annulus_samples(outer_radius, inner_radius, cell_radius):
+    """Points (km offsets) of the annulus the planner checks coverage on, with denser points along its edges."""
+    step = cell_radius / SAMPLES_PER_CELL_RADIUS
+    count = int(outer_radius / step) + 1
+    points = [
+        (i * step, j * step)
+        for i in range(-count, count + 1)
+        for j in range(-count, count + 1)
+        if inner_radius <= math.hypot(i * step, j * step) <= outer_radius
+    ]
+    for edge_radius in (outer_radius, inner_radius):
+        if edge_radius > 0:
+            edge_count = int(2 * math.pi * edge_radius / (step / 2)) + 1
+            points.extend(
+                (edge_radius * math.cos(2 * math.pi * k / edge_count), edge_radius * math.sin(2 * math.pi * k / edge_count))
+                for k in range(edge_count)
+            )
+    return points
+
+
+def _drop_redundant_cells(cells, samples, cell_radius):
+    """Remove, outermost first, every circle whose sample points are all covered by the remaining circles."""
+    covering = [[k for k, (x, y) in enumerate(cells) if math.hypot(px - x, py - y) <= cell_radius] for px, py in samples]
+    kept = set(range(len(cells)))
+    for k in sorted(kept, key=lambda k: -math.hypot(*cells[k])):
+        if all(any(other in kept and other != k for other in circles) for circles in covering if k in circles):
+            kept.discard(k)
+    return [cells[k] for k in sorted(kept)]
+
+
+@functools.lru_cache(maxsize=256)
+def plan_annulus(outer_radius, inner_radius, cell_radius):
+    """
+    Near-minimal set of circles of cell_radius covering the annulus inner_radius..outer_radius, as km offsets.
+
+    The hexagonal lattice cells give a gap-free cover, the circles whose area is also covered by their neighbours
+    are then dropped. This is done for a few lattice offsets and rotations, the centred lattice first so it wins
+    ties, and the plan needing the fewest circles is kept. The plan only depends on the radii, so it is computed
+    once and reused for every location.
+
+    Returns:
+    - tuple of (km east, km north) offsets from the search centre
+    """
+    spacing = math.sqrt(3) * cell_radius
+    samples = _annulus_samples(outer_radius, inner_radius, cell_radius)
+    best = None
+    for rotation_step in range(ROTATION_STEPS):
+        rotation = rotation_step * (math.pi / 3) / ROTATION_STEPS
+        for u_step in range(PHASE_STEPS):
+            for v_step in range(PHASE_STEPS):
+                u, v = u_step / PHASE_STEPS, v_step / PHASE_STEPS
+                offset = (
+                    spacing * (u + 0.5 * v) * math.cos(rotation) - spacing * (math.sqrt(3) / 2 * v) * math.sin(rotation),
+                    spacing * (u + 0.5 * v) * math.sin(rotation) + spacing * (math.sqrt(3) / 2 * v) * math.cos(rotation),
+                )
+                cells = _hex_lattice_cells(outer_radius, inner_radius, cell_radius, offset, rotation)
+                cells = _drop_redundant_cells(cells, samples, cell_radius)
+                if best is None or len(cells) < len(best):
+                    best = cells
+    return tuple(best)
+
+
+def plan_coverage(latitude, longitude, radius, depth_degree=1):
+    """
+    Plan the vendor search circles covering the requested radius, with the same resolution levels as
+    get_equivalent_smaller_grids but without gaps and with as few circles as the hexagonal lattice allows.
+
+    Level k covers the ring between the disc left to level k + 1 and the disc of level k - 1 with circles of
+    radius ceil(radius / 2 ** k) km, so the dense centre gets the finest circles. Radii are whole kilometers because
+    the vendor request only takes an integer distance. Offsets are laid out in kilometers and projected with the
+    exact distance and bearing from the centre, so the plan holds at any latitude.
+
+    Parameters:
+    - latitude (float): The latitude of the central point in decimal degrees.
+    - longitude (float): The longitude of the central point in decimal degrees.
+    - radius (float): The radius in kilometers to cover.
+    - depth_degree (int): Number of resolution levels, 0 keeps the single requested circle.
+
+    Returns:
+    - list of tuples: (latitude, longitude, radius) of every vendor call
+    """
+    levels = []
+    for level in range(1, depth_degree + 1):
+        cell_radius = max(1, math.ceil(radius / GRID_DIVISION_FACTOR**level))
+        if levels and cell_radius >= levels[-1]:
+            break
+        levels.append(cell_radius)
+    if not levels:
+        return [(latitude, longitude, radius)]
+
+    locations = []
+    outer_radius = radius
+    for index, cell_radius in enumerate(levels):
+        inner_radius = cell_radius if index + 1 < len(levels) else 0
+        locations.extend(_project_offsets(latitude, longitude, plan_annulus(outer_radius, inner_radius, cell_radius), cell_radius))
+        outer_radius = inner_radius
     return locations
 
 
+def _project_offsets(latitude, longitude, offsets, cell_radius):
+    """(latitude, longitude, cell_radius) of every (km east, km north) offset from the centre."""
+    locations = []
+    for x, y in offsets:
+        if x == 0 and y == 0:
+            locations.append((latitude, longitude, cell_radius))
+            continue
+        lat, lng = destination_point(latitude, longitude, math.atan2(x, y), math.hypot(x, y))
+        locations.append((lat, lng, cell_radius))
+    return locations
+
+
+def refine_cell(latitude, longitude, radius):
+    """
+    Split one search circle into the circles of the next resolution level covering it, for the adaptive planning
+    of dense areas. The children overlap the parent, the hotels found again are dropped by the leg dedupe.
+
+    Parameters:
+    - latitude (float): The latitude of the cell centre in decimal degrees.
+    - longitude (float): The longitude of the cell centre in decimal degrees.
+    - radius (float): The radius of the cell in kilometers.
+
+    Returns:
+    - list of tuples: (latitude, longitude, radius) of the child circles, empty when the radius cannot get smaller
+    """
+    cell_radius = max(1, math.ceil(radius / GRID_DIVISION_FACTOR))
+    if cell_radius >= radius:
+        return []
+    return _project_offsets(latitude, longitude, plan_annulus(radius, 0, cell_radius), cell_radius)
+
+
+def coverage_ratio(latitude, longitude, radius, locations, rings=24, points_per_ring=72):
+    """
+    Share of the requested disc covered by the planned circles, measured on sample points of concentric rings.
+
+    Returns:
+    - float between 0 and 1
+    """
+    samples = [(latitude, longitude)]
+    for ring in range(1, rings + 1):
+        distance = radius * ring / rings
+        for step in range(points_per_ring):
+            samples.append(destination_point(latitude, longitude, 2 * math.pi * step / points_per_ring, distance))
+    covered = sum(
+        1 for lat, lng in samples if any(haversine_km(lat, lng, c_lat, c_lng) <= c_radius for c_lat, c_lng, c_radius in locations)
+    )
+    return covered / len(samples)
+
+
 if __name__ == "__main__":
     # Example coordinates and radius
     lt, long, large_radius_km = 36.171563, -115.1391009, 30
@@ -0,0 +1,174 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from s3connector import save_to_s3
+
+try:
+    import msgpack
+except ImportError:  # Messages are JSON encoded without it
+    msgpack = None
+
+MESSAGE_FORMAT_VERSION = int(os.getenv("HOTEL_DETAILS_MESSAGE_FORMAT", 1))  # 1 embeds the payload, 2 references it
+MESSAGE_ENCODING = os.getenv("HOTEL_DETAILS_MESSAGE_ENCODING", "json")  # json or msgpack, msgpack needs format 2
+REFERENCE_PREFIX = os.getenv("HOTEL_DETAILS_REFERENCE_PREFIX", "hotel_details_refs")  # S3 folder of the shared objects
+REFERENCE_CACHE_SIZE = int(os.getenv("HOTEL_DETAILS_REFERENCE_CACHE_SIZE", 1024))  # Stored objects remembered per process
+HOTEL_FIELDS = ["hotel_id", "hotel_chain"]
+
+# digest -> reference of the objects already stored, least recently used first
+_stored_references = OrderedDict()
+# digest -> future of the reference of the objects being stored
+_pending_uploads = {}
+_stored_references_lock = threading.Lock()
+
+
+def store_reference(kind, value):
+    """
+    Store value once in S3 under a key derived from its content, so every batch, location and invocation
+    publishing the same value shares one object. Only the last REFERENCE_CACHE_SIZE stored values are
+    remembered, a value evicted from them is stored again under the same key when it comes back. The upload runs
+    outside the lock, callers storing the same value meanwhile wait for it and the others are not held up.
+    :param kind: folder of the object, e.g. payload or membership
+    :param value: JSON serialisable value
+    :return: s3://bucket/key reference of the object
+    """
+    content = json.dumps(value, sort_keys=True, default=str)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    with _stored_references_lock:
+        reference = _stored_references.get(digest)
+        if reference is not None:
+            _stored_references.move_to_end(digest)
+            return reference
+        upload = _pending_uploads.get(digest)
+        uploading = upload is None
+        if uploading:
+            upload = _pending_uploads[digest] = Future()
+    if not uploading:
+        return upload.result()
+
+    bucket = os.environ.get("HOTEL_S3_BUCKET_NAME")
+    key = f"{REFERENCE_PREFIX}/{kind}/{digest}.json"
+    try:
+        save_to_s3(bucket, key, content)
+    except BaseException as exception:
+        with _stored_references_lock:
+            del _pending_uploads[digest]
+        upload.set_exception(exception)
+        raise
+    reference = f"s3://{bucket}/{key}"
+    with _stored_references_lock:
+        _stored_references[digest] = reference
+        while len(_stored_references) > REFERENCE_CACHE_SIZE:
+            _stored_references.popitem(last=False)
+        del _pending_uploads[digest]
+    upload.set_result(reference)
+    return reference
+
+
+def _chain_key(hotel_chain):
+    """
+    Key of a hotel chain in the memberships of a batch. msgpack and JSON maps only keep string keys, a hotel
+    without a chain is under "".
+    """
+    return "" if hotel_chain is None else str(hotel_chain)
+
+
+def build_batch(batch_data, version=MESSAGE_FORMAT_VERSION):
+    """
+    Hotel details batch in the configured message format.
+
+    Version 2 replaces the request payload and the membership deal mappings with references to objects stored
+    once, and carries the hotels as rows of HOTEL_FIELDS.
+    :param batch_data: version 1 batch, as built by publish_to_topic
+    :param version: message format version
+    :return: batch dict
+    """
+    if version < 2:
+        return batch_data
+    memberships = {}
+    for hotel in batch_data["hotel_data"]:
+        mapping = hotel.get("membership_deal_mapping")
+        chain = _chain_key(hotel.get("hotel_chain"))
+        if "membership_deal_mapping" in hotel and chain not in memberships:
+            # Empty mappings are kept inline, only the actual deal documents are worth a reference
+            memberships[chain] = store_reference("membership", mapping) if mapping else mapping
+    return {
+        "format_version": 2,
+        "payload_ref": store_reference("payload", batch_data["request_payload"]),
+        "fields": HOTEL_FIELDS,
+        "hotels": [[hotel.get(field) for field in HOTEL_FIELDS] for hotel in batch_data["hotel_data"]],
+        "memberships": memberships,
+        "batch_num": batch_data["batch_num"],
+        "s3_metadata": batch_data["s3_metadata"],
+        "total_batches": batch_data["total_batches"],
+        "published_at": batch_data["published_at"],
+    }
+
+
+def serialize(batch, encoding=MESSAGE_ENCODING):
+    """
+    Message value of a batch
+    :param batch: batch dict from build_batch
+    :param encoding: json or msgpack, version 1 batches are always JSON
+    :return: bytes
+    """
+    if encoding == "msgpack" and msgpack is not None and batch.get("format_version", 1) >= 2:
+        return msgpack.packb(batch, default=str, use_bin_type=True)
+    return json.dumps(batch, default=str).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=1024)
+def _fetch_from_s3(reference):
+    import boto3  # Only the consumers resolving references need it
+
+    bucket, key = reference[len("s3://") :].split("/", 1)
+    return json.loads(boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def decode_batch(value, fetch=None):
+    """
+    Hotel details batch in the version 1 shape, whatever the format it was published in, for the consumers
+    during the migration.
+    :param value: message value (JSON or msgpack bytes), or an already decoded dict
+    :param fetch: callable returning the object of an s3:// reference, S3 through boto3 by default
+    :return: dict with request_payload, hotel_data, batch_num, s3_metadata, total_batches and published_at
+    """
+    fetch = fetch or _fetch_from_s3
+    if isinstance(value, (bytes, bytearray)):
+        if value[:1] in (b"{", b"["):
+            batch = json.loads(value)
+        elif msgpack is not None:
+            batch = msgpack.unpackb(value, raw=False)
+        else:
+            raise ValueError("msgpack encoded hotel details batch, msgpack is not installed")
+    elif isinstance(value, str):
+        batch = json.loads(value)
+    else:
+        batch = value
+
+    if batch.get("format_version", 1) < 2:
+        return batch
+
+    memberships = {
+        chain: fetch(mapping) if isinstance(mapping, str) and mapping.startswith("s3://") else mapping
+        for chain, mapping in batch["memberships"].items()
+    }
+    hotel_data = []
+    for row in batch["hotels"]:
+        hotel = dict(zip(batch["fields"], row))
+        chain = _chain_key(hotel.get("hotel_chain"))
+        if chain in memberships:
+            hotel["membership_deal_mapping"] = memberships[chain]
+        hotel_data.append(hotel)
+    return {
+        "request_payload": fetch(batch["payload_ref"]),
+        "hotel_data": hotel_data,
+        "batch_num": batch["batch_num"],
+        "s3_metadata": batch["s3_metadata"],
+        "total_batches": batch["total_batches"],
+        "published_at": batch["published_at"],
+    }
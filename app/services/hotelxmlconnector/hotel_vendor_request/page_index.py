@@ -0,0 +1,153 @@
+import json
+import mmap
+import os
+import re
+
+from lxml import etree
+
+ARCHIVE_PAGE_FORMAT = os.getenv("HOTEL_ARCHIVE_PAGE_FORMAT", "raw")  # raw, or indexed with a hotel index sidecar
+INDEX_SUFFIX = ".idx.json"
+INDEX_FORMAT_VERSION = 1
+RANGE_MERGE_GAP = int(os.getenv("HOTEL_ARCHIVE_RANGE_MERGE_GAP", 16384))  # In bytes, closer hotels are read at once
+
+_XMLNS = re.compile(rb'xmlns(?::([\w.-]+))?\s*=\s*(["\'])(.*?)\2')
+
+
+def _local_name(xpath):
+    """Local name of the last step of an xpath, e.g. HotelSearchResult for /x:Envelope/.../y:HotelSearchResult."""
+    return xpath.rstrip("/").rsplit("/", 1)[-1].split(":")[-1]
+
+
+def result_spans(content, result_tag):
+    """
+    Byte span of every result element of a page, in document order
+    :param content: raw page bytes
+    :param result_tag: local name of the result elements, whatever their prefix
+    :return: list of (offset, length)
+    """
+    name = re.escape(result_tag.encode("utf-8"))
+    tags = re.compile(rb"<(/?)(?:[\w.-]+:)?" + name + rb"(?=[\s/>])(?:[^>\"']|\"[^\"]*\"|'[^']*')*?(/?)>")
+    spans = []
+    depth = 0
+    start = None
+    for tag in tags.finditer(content):
+        closing, self_closing = tag.group(1), tag.group(2)
+        if closing:
+            depth -= 1
+            if depth == 0:
+                spans.append((start, tag.end() - start))
+        elif self_closing:
+            if depth == 0:
+                spans.append((tag.start(), tag.end() - tag.start()))
+        else:
+            if depth == 0:
+                start = tag.start()
+            depth += 1
+    return spans
+
+
+def build_hotel_index(content, hotel_ids, result_xpath, object_key):
+    """
+    Sidecar index of an archived page: hotel_id -> byte offset and length of its result element
+    :param content: raw page bytes, as archived uncompressed
+    :param hotel_ids: hotel id of every result element, in document order, e.g. from HotelExtractor.extract
+    :param result_xpath: result xpath of the vendor mapping
+    :param object_key: key of the archived page
+    :return: index dict, None when the results found in the bytes do not line up with hotel_ids
+    """
+    content = content.encode("utf-8") if isinstance(content, str) else content
+    spans = result_spans(content, _local_name(result_xpath))
+    if not spans or len(spans) != len(hotel_ids):
+        return None
+    hotels = {}
+    for hotel_id, span in zip(hotel_ids, spans):
+        # A hotel repeated on the page keeps its first result
+        hotels.setdefault(hotel_id, list(span))
+    # Prefixes declared above the results, needed to parse a result on its own
+    xmlns = {
+        (match.group(1) or b"").decode("utf-8"): match.group(3).decode("utf-8")
+        for match in _XMLNS.finditer(content, 0, spans[0][0])
+    }
+    return {"format_version": INDEX_FORMAT_VERSION, "object_key": object_key, "xmlns": xmlns, "hotels": hotels}
+
+
+def dumps(index):
+    return json.dumps(index, separators=(",", ":"))
+
+
+def _merged_ranges(spans, merge_gap):
+    ranges = []
+    for offset, length in sorted(spans):
+        if ranges and offset - ranges[-1][1] <= merge_gap:
+            ranges[-1][1] = max(ranges[-1][1], offset + length)
+        else:
+            ranges.append([offset, offset + length])
+    return ranges
+
+
+def read_hotels(index, hotel_ids, fetch_range, merge_gap=RANGE_MERGE_GAP):
+    """
+    Result element bytes of some hotels of an indexed page, reading only their ranges. Hotels closer than
+    merge_gap share one read.
+    :param index: the sidecar index of the page
+    :param hotel_ids: hotels wanted, the ones missing from the index are skipped
+    :param fetch_range: callable(start, end) returning bytes start..end - 1 of the page
+    :param merge_gap: largest gap in bytes read through to merge two ranges
+    :return: dict hotel_id -> bytes
+    """
+    wanted = {hotel_id: index["hotels"][hotel_id] for hotel_id in hotel_ids if hotel_id in index["hotels"]}
+    fragments = {}
+    for start, end in _merged_ranges(wanted.values(), merge_gap):
+        block = fetch_range(start, end)
+        for hotel_id, (offset, length) in wanted.items():
+            if start <= offset < end:
+                fragments[hotel_id] = block[offset - start : offset - start + length]
+    return fragments
+
+
+def parse_fragment(index, fragment):
+    """
+    Result element of a fragment from read_hotels, with the namespaces of the page
+    :param index: the sidecar index of the page
+    :param fragment: bytes of one result element
+    :return: lxml element, the result xpaths of the mapping apply below it as in the full page
+    """
+    declarations = " ".join(
+        f'xmlns:{prefix}="{uri}"' if prefix else f'xmlns="{uri}"' for prefix, uri in index["xmlns"].items()
+    )
+    wrapper = etree.fromstring(f"<hotel_index_fragment {declarations}>".encode("utf-8") + fragment + b"</hotel_index_fragment>")
+    return wrapper[0]
+
+
+def s3_range_fetcher(bucket, key, client=None):
+    """
+    fetch_range over HTTP range reads of an S3 object
+    :param bucket: bucket of the page
+    :param key: key of the page
+    :param client: boto3 S3 client, created when not given
+    :return: callable(start, end)
+    """
+    if client is None:
+        import boto3  # Only the consumers reading pages need it
+
+        client = boto3.client("s3")
+
+    def fetch_range(start, end):
+        return client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+
+    return fetch_range
+
+
+def mmap_range_fetcher(path):
+    """
+    fetch_range slicing a memory-mapped local copy of a page
+    :param path: local file of the page
+    :return: callable(start, end), the map stays open as long as the callable
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def fetch_range(start, end):
+        return mapped[start:end]
+
+    return fetch_range
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from kafkaconnector import KafkaConnector
+from opensearchlogger.logging import logger
+
+from . import message_format
+
+try:
+    from confluent_kafka import Producer
+except ImportError:  # The KafkaConnector of the helper layer is used instead
+    Producer = None
+
+KAFKA_PRODUCER_MODE = os.getenv("HOTEL_KAFKA_PRODUCER", "shared")  # shared or connector
+KAFKA_LINGER_MS = int(os.getenv("HOTEL_KAFKA_LINGER_MS", 20))  # Wait to fill a batch, in ms
+KAFKA_BATCH_SIZE = int(os.getenv("HOTEL_KAFKA_BATCH_SIZE", 262144))  # Max bytes per partition batch
+KAFKA_COMPRESSION = os.getenv("HOTEL_KAFKA_COMPRESSION", "lz4")
+KAFKA_FLUSH_TIMEOUT = float(os.getenv("HOTEL_KAFKA_FLUSH_TIMEOUT", 30))  # In sec
+
+DeliveryResult = namedtuple("DeliveryResult", ["topic", "key", "batch_num", "partition", "offset", "error"])
+
+_producer = None
+_producer_lock = threading.Lock()
+
+
+class DeliveryTracker:
+    """Delivery results of the messages of one vendor request location, filled by the delivery callbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.results = []
+
+    def sent(self):
+        with self._lock:
+            self.pending += 1
+
+    def delivered(self, result):
+        with self._lock:
+            self.pending -= 1
+            self.results.append(result)
+
+    def failures(self):
+        with self._lock:
+            return [result for result in self.results if result.error is not None]
+
+    def summary(self):
+        """
+        Counts of the tracked messages
+        :return: dict with delivered, failed and pending
+        """
+        with self._lock:
+            failed = sum(1 for result in self.results if result.error is not None)
+            return {"delivered": len(self.results) - failed, "failed": failed, "pending": self.pending}
+
+
+class HotelDetailsProducer:
+    """
+    Process-wide producer of the hotel details topic.
+
+    Messages are queued on one long-lived confluent_kafka producer which batches them (linger and batch size)
+    and compresses them, instead of a KafkaConnector per batch of hotels. Delivery is reported asynchronously
+    to the DeliveryTracker of the caller, flush() waits for the messages of one tracker at the end of a vendor
+    request. Without confluent_kafka or with HOTEL_KAFKA_PRODUCER=connector every message goes through
+    KafkaConnector synchronously, with the same results. KafkaConnector is given the batch dict and JSON encodes
+    it, the shared producer sends the key and value of encode_message.
+    """
+
+    def __init__(self):
+        self.producer = None
+        self.encoding = "json"
+        if KAFKA_PRODUCER_MODE == "shared" and (Producer is None or not os.getenv("KAFKA_BOOTSTRAP_SERVERS")):
+            logger.error(
+                "Shared hotel details producer requested but "
+                + ("confluent_kafka is not installed" if Producer is None else "KAFKA_BOOTSTRAP_SERVERS is not set")
+                + ", publishing every message through KafkaConnector"
+            )
+        elif KAFKA_PRODUCER_MODE == "shared":
+            config = {
+                "bootstrap.servers": os.getenv("KAFKA_BOOTSTRAP_SERVERS"),
+                "linger.ms": KAFKA_LINGER_MS,
+                "batch.size": KAFKA_BATCH_SIZE,
+                "compression.type": KAFKA_COMPRESSION,
+                "enable.idempotence": True,
+            }
+            if os.getenv("KAFKA_SECURITY_PROTOCOL"):
+                config["security.protocol"] = os.getenv("KAFKA_SECURITY_PROTOCOL")
+            if os.getenv("KAFKA_SASL_MECHANISM"):
+                config.update(
+                    {
+                        "sasl.mechanisms": os.getenv("KAFKA_SASL_MECHANISM"),
+                        "sasl.username": os.getenv("KAFKA_SASL_USERNAME"),
+                        "sasl.password": os.getenv("KAFKA_SASL_PASSWORD"),
+                    }
+                )
+            self.producer = Producer(config)
+            self.encoding = message_format.MESSAGE_ENCODING
+
+    def produce(self, messages, tracker):
+        """
+        Queue one batch of hotels
+        :param messages: dict with kafka_topic, kafka_key and batch_data, as for KafkaConnector.produce, batch_data is
+            serialised with message_format.serialize
+        :param tracker: DeliveryTracker receiving the delivery result
+        :return: serialised size of the message in bytes
+        """
+        topic, key, batch_data = messages["kafka_topic"], messages["kafka_key"], messages["batch_data"]
+        batch_num = batch_data.get("batch_num")
+        key_bytes, value = encode_message(messages, self.encoding)
+        tracker.sent()
+        if self.producer is None:
+            error = None
+            try:
+                # KafkaConnector JSON encodes batch_data itself, value is only serialised for its size
+                KafkaConnector().produce(messages, is_parallel_push=True)
+            except Exception as exception:
+                error = str(exception)
+                logger.error(f"Error while publishing batch {batch_num} to {topic}: {traceback.format_exc()}")
+            tracker.delivered(DeliveryResult(topic, key, batch_num, None, None, error))
+            return len(value)
+
+        def on_delivery(error, message):
+            tracker.delivered(
+                DeliveryResult(
+                    topic,
+                    key,
+                    batch_num,
+                    message.partition() if error is None else None,
+                    message.offset() if error is None else None,
+                    str(error) if error is not None else None,
+                )
+            )
+
+        while True:
+            try:
+                self.producer.produce(topic, value=value, key=key_bytes, on_delivery=on_delivery)
+                break
+            except BufferError:
+                # Local queue full, serve the delivery callbacks to make room
+                self.producer.poll(0.5)
+        self.producer.poll(0)
+        return len(value)
+
+    def flush(self, tracker, timeout=KAFKA_FLUSH_TIMEOUT):
+        """
+        Wait for the delivery of the messages of tracker
+        :param tracker: DeliveryTracker of the vendor request location
+        :param timeout: seconds to wait at most
+        :return: tracker summary, messages still undelivered at the timeout are counted as pending
+        """
+        deadline = time.monotonic() + timeout
+        while self.producer is not None and tracker.pending > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.producer.poll(min(remaining, 0.1))
+        return tracker.summary()
+
+
+def encode_message(messages, encoding=message_format.MESSAGE_ENCODING):
+    """
+    Kafka key and value of a hotel details message
+    :param messages: dict with kafka_key and batch_data
+    :param encoding: json or msgpack, see message_format.serialize
+    :return: (key bytes, value bytes)
+    """
+    return str(messages["kafka_key"]).encode("utf-8"), message_format.serialize(messages["batch_data"], encoding)
+
+
+def get_producer():
+    """
+    The process-wide hotel details producer, created on first use
+    :return: HotelDetailsProducer
+    """
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = HotelDetailsProducer()
+    return _producer
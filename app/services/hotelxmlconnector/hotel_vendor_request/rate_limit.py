@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from helperlayer import ItiliteBaseException
+
+VENDOR_RATE_LIMIT_RPS = float(os.getenv("VENDOR_RATE_LIMIT_RPS", 20))  # Starting token refill rate, requests per sec
+VENDOR_RATE_LIMIT_MIN_RPS = float(os.getenv("VENDOR_RATE_LIMIT_MIN_RPS", 1))
+VENDOR_RATE_LIMIT_MAX_RPS = float(os.getenv("VENDOR_RATE_LIMIT_MAX_RPS", 100))
+VENDOR_RATE_LIMIT_BURST = float(os.getenv("VENDOR_RATE_LIMIT_BURST", 20))  # Tokens the bucket holds
+VENDOR_CONCURRENCY = float(os.getenv("VENDOR_CONCURRENCY", 16))  # Starting concurrent calls per endpoint
+VENDOR_MIN_CONCURRENCY = float(os.getenv("VENDOR_MIN_CONCURRENCY", 1))
+VENDOR_MAX_CONCURRENCY = float(os.getenv("VENDOR_MAX_CONCURRENCY", 64))
+VENDOR_LATENCY_TARGET = float(os.getenv("VENDOR_LATENCY_TARGET", 30))  # In sec, slower calls count as overload
+VENDOR_FAULT_RATE_THRESHOLD = float(os.getenv("VENDOR_FAULT_RATE_THRESHOLD", 0.5))  # Smoothed share of overloaded calls
+VENDOR_DECREASE_FACTOR = float(os.getenv("VENDOR_DECREASE_FACTOR", 0.5))
+VENDOR_DECREASE_COOLDOWN = float(os.getenv("VENDOR_DECREASE_COOLDOWN", 5))  # In sec, between two decreases
+VENDOR_ACQUIRE_TIMEOUT = float(os.getenv("VENDOR_ACQUIRE_TIMEOUT", 120))  # In sec
+FAULT_RATE_SMOOTHING = 0.1
+OVERLOAD_STATUS_CODES = (429, 503, 504)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class VendorSlotTimeout(ItiliteBaseException):
+    """
+    No limiter slot within the acquire timeout. An ItiliteBaseException, so a saturated endpoint ends the location
+    as a vendor error (NO_RESULT, or the pages already published) instead of a failure of the connector.
+    """
+
+
+class VendorCall:
+    """Outcome of one call made within a limiter slot."""
+
+    def __init__(self):
+        self.status_code = None
+
+    def record(self, status_code):
+        """
+        Record the HTTP status of the vendor response.
+
+        Args:
+            status_code (int): Status code, SOAP faults come back as 500.
+        """
+        self.status_code = status_code
+
+
+class EndpointLimiter:
+    """
+    Token bucket plus AIMD concurrency limit of one vendor endpoint.
+
+    A call needs a token and a free concurrency slot. Calls completing under the latency target while the callers
+    are held by a limit raise it, the concurrency limit by 1 / limit and the refill rate by 1 / rate, about one
+    more call and one more request per second per round of calls. Overload status codes, transport errors, calls
+    over the latency target and a smoothed fault rate over the threshold halve both, at most once per cooldown,
+    so a burst of faults is one decrease. Throughput then tracks the capacity the vendor actually gives instead
+    of collapsing into faults. Other error statuses are answers of the vendor, e.g. the uAPI SOAP fault (HTTP 500)
+    of a cell without availability, and leave the limits and the fault rate alone.
+    """
+
+    def __init__(
+        self,
+        endpoint,
+        rate=VENDOR_RATE_LIMIT_RPS,
+        burst=VENDOR_RATE_LIMIT_BURST,
+        concurrency=VENDOR_CONCURRENCY,
+        latency_target=VENDOR_LATENCY_TARGET,
+    ):
+        self.endpoint = endpoint
+        self.rate = rate
+        self.burst = burst
+        self.concurrency_limit = concurrency
+        self.latency_target = latency_target
+        self.tokens = burst
+        self.in_flight = 0
+        self.fault_rate = 0.0
+        self.calls = 0
+        self.faults = 0
+        self.decreases = 0
+        self.waited = 0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self, timeout=VENDOR_ACQUIRE_TIMEOUT):
+        """
+        Wait for a token and a concurrency slot.
+
+        Args:
+            timeout (float): Seconds to wait at most.
+
+        Raises:
+            VendorSlotTimeout: When no slot was free within timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                slot_free = self.in_flight < max(1, int(self.concurrency_limit))
+                if slot_free and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    self.waited += waited
+                    return
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise VendorSlotTimeout(f"No vendor call slot for {self.endpoint} within {timeout} sec")
+                waited = True
+                # A released slot notifies, a missing token is only refilled with time
+                self._condition.wait(remaining if not slot_free else min(remaining, (1 - self.tokens) / self.rate))
+
+    def release(self, latency, status_code=None, failed=False):
+        """
+        Free the slot of a call and adapt the limits to its outcome.
+
+        Args:
+            latency (float): Duration of the call in sec.
+            status_code (int): HTTP status of the response, None when the call raised.
+            failed (bool): The call raised, e.g. a timeout or a connection error.
+        """
+        faulted = failed or status_code in OVERLOAD_STATUS_CODES
+        overloaded = faulted or latency > self.latency_target
+        with self._condition:
+            self.in_flight -= 1
+            self.calls += 1
+            self.faults += faulted
+            self.fault_rate += FAULT_RATE_SMOOTHING * (faulted - self.fault_rate)
+            now = time.monotonic()
+            if overloaded or self.fault_rate > VENDOR_FAULT_RATE_THRESHOLD:
+                if now - self._decreased_at >= VENDOR_DECREASE_COOLDOWN:
+                    self._refill(now)
+                    self.concurrency_limit = max(VENDOR_MIN_CONCURRENCY, self.concurrency_limit * VENDOR_DECREASE_FACTOR)
+                    self.rate = max(VENDOR_RATE_LIMIT_MIN_RPS, self.rate * VENDOR_DECREASE_FACTOR)
+                    self._decreased_at = now
+                    self.decreases += 1
+            else:
+                # Only a limit the callers actually run into is raised, an idle endpoint keeps its limits
+                self._refill(now)
+                if self.in_flight + 1 >= int(self.concurrency_limit):
+                    self.concurrency_limit = min(VENDOR_MAX_CONCURRENCY, self.concurrency_limit + 1 / self.concurrency_limit)
+                if self.tokens < 1:
+                    self.rate = min(VENDOR_RATE_LIMIT_MAX_RPS, self.rate + 1 / self.rate)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a slot for the duration of one vendor call, record its status on the yielded VendorCall.
+
+        Yields:
+            VendorCall: Where the caller records the response status.
+        """
+        self.acquire()
+        call = VendorCall()
+        start = time.monotonic()
+        try:
+            yield call
+        except BaseException:
+            self.release(time.monotonic() - start, failed=True)
+            raise
+        self.release(time.monotonic() - start, call.status_code)
+
+    def stats(self):
+        """Current limits and counters of the endpoint."""
+        with self._condition:
+            return {
+                "rate_limit": round(self.rate, 3),
+                "concurrency_limit": round(self.concurrency_limit, 3),
+                "in_flight": self.in_flight,
+                "fault_rate": round(self.fault_rate, 4),
+                "calls": self.calls,
+                "faults": self.faults,
+                "decreases": self.decreases,
+                "waited": self.waited,
+            }
+
+
+def get_limiter(endpoint):
+    """
+    Shared limiter of the endpoint, so every vendor connector of the process draws on the same limits.
+
+    Args:
+        endpoint (str): Vendor end point, as in the FRE config.
+
+    Returns:
+        EndpointLimiter: The process-wide limiter of endpoint.
+    """
+    limiter = _limiters.get(endpoint)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(endpoint)
+            if limiter is None:
+                limiter = EndpointLimiter(endpoint)
+                _limiters[endpoint] = limiter
+    return limiter
+
+
+def limiter_stats():
+    """
+    Limits of every endpoint called since the start of the process.
+
+    Returns:
+        dict: endpoint -> EndpointLimiter.stats()
+    """
+    return {endpoint: limiter.stats() for endpoint, limiter in list(_limiters.items())}
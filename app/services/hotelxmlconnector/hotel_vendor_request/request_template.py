@@ -0,0 +1,199 @@
+"""
+String template of the uAPI HotelSearchAvailabilityReq SOAP envelope.
+
+Every page of every grid cell sends the same request shape, only the coordinates, radius, dates, currency,
+permitted chains and NextResultReference change. Rendering it from a template skips the pydantic models and
+zeep's object serialisation. The output is byte-identical to what zeep posts for uAPI V18 (hotel_v46_0) and
+V22 (hotel_v52_0): same namespace prefixes, element and attribute order, escaping and XML declaration.
+
+The builder is opt-in with GDS_REQUEST_BUILDER=template. GDSHotels checks the first rendered request of the
+process against zeep and falls back to zeep when they differ. tests/test_request_template.py asserts the parity
+through the GDSHotels params path for both uAPI versions, and the check below can be run by hand as well:
+    python -m app.services.hotelxmlconnector.hotel_vendor_request.request_template
+"""
+import os
+from xml.sax.saxutils import escape
+
+from zeep import Client, Settings
+from zeep.wsdl.utils import etree_to_string
+
+REQUEST_BUILDER = os.getenv("GDS_REQUEST_BUILDER", "zeep")  # zeep or template
+SOAP_ACTION = "http://localhost:8080/kestrel/HotelService"
+HTTP_HEADERS = {"SOAPAction": f'"{SOAP_ACTION}"', "Content-Type": "text/xml; charset=utf-8"}
+
+_XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+_SOAP_ENV_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+# lxml escapes these in attribute values on top of &, < and >
+_ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def _attr(value):
+    return escape(str(value), _ATTRIBUTE_ENTITIES)
+
+
+def render_hotel_search_request(
+    wsdl_version,
+    target_branch,
+    latitude,
+    longitude,
+    radius,
+    check_in_date,
+    check_out_date,
+    no_of_adults=1,
+    no_of_rooms=1,
+    currency="INR",
+    permitted_chains=None,
+    next_page_reference=None,
+    trace_id="12345",
+    provider_code="1G",
+):
+    """
+    Render the HotelSearchAvailabilityReq envelope as zeep serialises it on the wire.
+
+    Args:
+        wsdl_version (str): TP_UAPI_WSDL_VERSION, e.g. v46 or v52.
+        target_branch (str): Travelport target branch of the account.
+        latitude (float): Latitude of the search, already rounded.
+        longitude (float): Longitude of the search, already rounded.
+        radius (int): Search radius in KM.
+        check_in_date (str): Check-in date, YYYY-MM-DD.
+        check_out_date (str): Check-out date, YYYY-MM-DD.
+        no_of_adults (int): Number of adults.
+        no_of_rooms (int): Number of rooms.
+        currency (str): Preferred currency.
+        permitted_chains (list): Hotel chain codes the search is restricted to.
+        next_page_reference (str): NextResultReference of the previous page.
+        trace_id (str): TraceId attribute.
+        provider_code (str): Permitted provider, also used for NextResultReference.
+
+    Returns:
+        bytes: The utf-8 encoded request body.
+    """
+    hotel_ns = f"http://www.travelport.com/schema/hotel_{wsdl_version}_0"
+    common_ns = f"http://www.travelport.com/schema/common_{wsdl_version}_0"
+    # zeep declares the common namespace again, under the next free prefix, on every element that uses it.
+    prefixes = iter(range(1, 16))
+
+    def common(tag, attributes, text=None, child=None):
+        prefix = f"ns{next(prefixes)}"
+        element = f'<{prefix}:{tag} xmlns:{prefix}="{common_ns}"{attributes}'
+        if child is not None:
+            child_tag, child_attributes = child
+            return f"{element}><{prefix}:{child_tag}{child_attributes}/></{prefix}:{tag}>"
+        if text is not None:
+            return f"{element}>{escape(text)}</{prefix}:{tag}>"
+        return element + "/>"
+
+    parts = [
+        _XML_DECLARATION,
+        f'<soap-env:Envelope xmlns:soap-env="{_SOAP_ENV_NS}"><soap-env:Body>',
+        f'<ns0:HotelSearchAvailabilityReq xmlns:ns0="{hotel_ns}" TraceId="{_attr(trace_id)}" '
+        f'TargetBranch="{_attr(target_branch)}" RetrieveProviderReservationDetails="false">',
+        common("BillingPointOfSaleInfo", ' OriginApplication="UAPI"'),
+    ]
+    if next_page_reference:
+        parts.append(common("NextResultReference", f' ProviderCode="{_attr(provider_code)}"', text=next_page_reference))
+    parts += [
+        "<ns0:HotelSearchLocation>",
+        common("CoordinateLocation", f' latitude="{_attr(latitude)}" longitude="{_attr(longitude)}"'),
+        common("Distance", f' Units="KM" Value="{_attr(radius)}"'),
+        "</ns0:HotelSearchLocation>",
+        f'<ns0:HotelSearchModifiers NumberOfAdults="{_attr(no_of_adults)}" NumberOfRooms="{_attr(no_of_rooms)}" '
+        f'PreferredCurrency="{_attr(currency)}" AvailableHotelsOnly="true" AggregateResults="true" '
+        'ReturnPropertyDescription="true" ReturnAmenities="true">',
+    ]
+    if permitted_chains:
+        chains = "".join(f'<ns0:HotelChain Code="{_attr(code)}"/>' for code in permitted_chains)
+        parts.append(f"<ns0:PermittedChains>{chains}</ns0:PermittedChains>")
+    parts += [
+        common("PermittedProviders", "", child=("Provider", f' Code="{_attr(provider_code)}"')),
+        "</ns0:HotelSearchModifiers>",
+        f"<ns0:HotelStay><ns0:CheckinDate>{escape(check_in_date)}</ns0:CheckinDate>"
+        f"<ns0:CheckoutDate>{escape(check_out_date)}</ns0:CheckoutDate></ns0:HotelStay>",
+        "</ns0:HotelSearchAvailabilityReq></soap-env:Body></soap-env:Envelope>",
+    ]
+    return "".join(parts).encode("utf-8")
+
+
+def render_zeep_request(soap_manager, params):
+    """
+    Serialise params with zeep exactly as its transport posts them.
+
+    Args:
+        soap_manager: A bound SOAPManager.
+        params (dict): The request payload of GDSHotels._request_handler.
+
+    Returns:
+        bytes: The utf-8 encoded request body.
+    """
+    return etree_to_string(soap_manager.create_message("service", **params))
+
+
+def check_parity(uapi_version, wsdl_version):
+    """
+    Compare the template with zeep for a set of representative requests of one uAPI version.
+
+    Returns:
+        list: Names of the cases whose bodies differ, empty when the template is byte-identical.
+    """
+    from app.services.hotelxmlconnector.hotel_vendor_request import schema_bundle
+
+    client = Client(schema_bundle.hotel_wsdl_path(uapi_version, wsdl_version), settings=Settings(strict=False, xml_huge_tree=True))
+    service = client.create_service(
+        "{http://www.travelport.com/service/hotel_" + wsdl_version + "_0}HotelSearchServiceBinding", "http://localhost"
+    )
+    base = {
+        "target_branch": "P7141733",
+        "latitude": 12.9716,
+        "longitude": 77.5946,
+        "radius": 5,
+        "check_in_date": "2025-03-31",
+        "check_out_date": "2025-04-01",
+    }
+    cases = {
+        "first_page": base,
+        "negative_coordinates": {**base, "latitude": -33.8688, "longitude": -151.2093, "currency": "USD"},
+        "whole_coordinates": {**base, "latitude": 40.0, "longitude": -74.0, "radius": 12},
+        "permitted_chains": {**base, "permitted_chains": ["MC", "RC", "AR"], "no_of_adults": 2, "no_of_rooms": 2},
+        "next_page": {**base, "next_page_reference": "H4sIAAAAAAAA/+1Y&W2<8>\"x'"},
+        "next_page_with_chains": {**base, "permitted_chains": ["MC"], "next_page_reference": "ABC123=="},
+    }
+
+    mismatches = []
+    for name, values in cases.items():
+        params = {
+            "TargetBranch": values["target_branch"],
+            "TraceId": "12345",
+            "BillingPointOfSaleInfo": "UAPI",
+            "HotelSearchLocation": {
+                "CoordinateLocation": {"latitude": values["latitude"], "longitude": values["longitude"]},
+                "Distance": {"Units": "KM", "Value": values["radius"]},
+            },
+            "HotelSearchModifiers": {
+                "NumberOfAdults": values.get("no_of_adults", 1),
+                "NumberOfRooms": values.get("no_of_rooms", 1),
+                "AvailableHotelsOnly": "true",
+                "ReturnPropertyDescription": "true",
+                "ReturnAmenities": "true",
+                "AggregateResults": "true",
+                "PermittedProviders": {"Provider": {"Code": "1G"}},
+                "PreferredCurrency": values.get("currency", "INR"),
+                "PermittedChains": (
+                    {"HotelChain": [{"Code": code} for code in values["permitted_chains"]]} if values.get("permitted_chains") else None
+                ),
+            },
+            "HotelStay": {"CheckinDate": values["check_in_date"], "CheckoutDate": values["check_out_date"]},
+        }
+        if values.get("next_page_reference"):
+            params["NextResultReference"] = {"ProviderCode": "1G", "_value_1": values["next_page_reference"]}
+
+        expected = etree_to_string(client.create_message(service, "service", **params))
+        if render_hotel_search_request(wsdl_version, **values) != expected:
+            mismatches.append(name)
+    return mismatches
+
+
+if __name__ == "__main__":
+    for uapi, wsdl in [("uAPI_V18", "v46"), ("uAPI_V22", "v52")]:
+        failed = check_parity(uapi, wsdl)
+        print(f"{uapi}/hotel_{wsdl}_0: {'byte-identical' if not failed else 'mismatch in ' + ', '.join(failed)}")
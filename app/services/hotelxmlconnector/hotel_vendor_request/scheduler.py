@@ -0,0 +1,217 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+VENDOR_IO_LANE = "vendor_io"  # Search locations and allied batches, waiting on the vendor
+CPU_LANE = "cpu"  # Parsing and splitting of the vendor responses
+PUBLISH_LANE = "publish"  # Kafka publishing and S3 uploads
+PAGE_PREFETCH_LANE = "page_prefetch"  # Next result page requests, sent while the page loop processes the current one
+
+SCHEDULER_THREAD_BUDGET = int(os.getenv("SCHEDULER_THREAD_BUDGET", 56))  # Threads of all lanes together, per process
+LANE_WORKERS = {
+    VENDOR_IO_LANE: int(os.getenv("SCHEDULER_VENDOR_IO_WORKERS", 24)),
+    CPU_LANE: int(os.getenv("SCHEDULER_CPU_WORKERS", os.cpu_count() or 2)),
+    PUBLISH_LANE: int(os.getenv("SCHEDULER_PUBLISH_WORKERS", 16)),
+    PAGE_PREFETCH_LANE: int(os.getenv("SCHEDULER_PAGE_PREFETCH_WORKERS", 8)),
+}
+# Lanes whose tasks are only worth running ahead of their join: a task still queued when joined runs inline on the
+# joining thread, whatever its lane, instead of waiting for a worker.
+INLINE_JOIN_LANES = {PAGE_PREFETCH_LANE}
+
+# Lane of the worker thread running the current task, None outside of the scheduler threads.
+_worker_lane = threading.local()
+
+
+def lane_sizes(thread_budget=SCHEDULER_THREAD_BUDGET, lane_workers=None):
+    """
+    Workers of every lane, scaled down proportionally when the lanes ask for more than the thread budget.
+
+    Args:
+        thread_budget (int): Threads of all lanes together.
+        lane_workers (dict): lane -> requested workers, LANE_WORKERS by default.
+
+    Returns:
+        dict: lane -> workers, at least one per lane.
+    """
+    lane_workers = lane_workers or LANE_WORKERS
+    requested = sum(lane_workers.values())
+    if requested <= thread_budget:
+        return dict(lane_workers)
+    return {lane: max(1, workers * thread_budget // requested) for lane, workers in lane_workers.items()}
+
+
+class _Task:
+    """A submitted call, run exactly once by either a lane worker or the thread joining it."""
+
+    def __init__(self, lane, fn, args, kwargs):
+        self.lane = lane
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # Every task runs in a copy of the context of its submitter, e.g. the logging ids of its leg
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.future.scheduler_task = self
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def claim(self):
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+    def execute(self):
+        """Run the claimed task, unless its future was cancelled."""
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.context.run(self.fn, *self.args, **self.kwargs)
+        except BaseException as exception:
+            self.future.set_exception(exception)
+        else:
+            self.future.set_result(result)
+
+
+class _Lane:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hotel-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.inline = 0
+        self.peak_queued = 0
+
+    def submit(self, task):
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        self.executor.submit(self._work, task)
+
+    def _work(self, task):
+        if not task.claim():
+            # Already run inline by the thread joining it
+            return
+        self._started()
+        _worker_lane.name = self.name
+        try:
+            task.execute()
+        finally:
+            _worker_lane.name = None
+            self._finished()
+
+    def run_inline(self, task):
+        if not task.claim():
+            return
+        self._started(inline=True)
+        try:
+            task.execute()
+        finally:
+            self._finished()
+
+    def _started(self, inline=False):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.inline += inline
+
+    def _finished(self):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "inline": self.inline,
+                "peak_queued": self.peak_queued,
+            }
+
+
+class Scheduler:
+    """
+    Process-wide executor of the connector, with one bounded thread pool per lane.
+
+    Every leg and every location shares the same lanes, so the thread count of the process stays within the
+    thread budget however many legs run concurrently, and the pools outlive warm invocations instead of being
+    created per request. A task waiting on a task of its own lane must use join(): when the awaited task has
+    not started yet, it runs inline on the waiting thread, so a lane full of waiting tasks cannot deadlock.
+    The page prefetch has a lane of its own, so the next page request of a page loop still runs alongside the
+    processing of the current page when the vendor IO lane is taken by the page loops themselves.
+    """
+
+    def __init__(self, thread_budget=SCHEDULER_THREAD_BUDGET, lane_workers=None):
+        self.thread_budget = thread_budget
+        self.lane_workers = lane_sizes(thread_budget, lane_workers)
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, name):
+        lane = self._lanes.get(name)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(name)
+                if lane is None:
+                    lane = _Lane(name, self.lane_workers[name])
+                    self._lanes[name] = lane
+        return lane
+
+    def submit(self, lane, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a lane.
+
+        Args:
+            lane (str): VENDOR_IO_LANE, CPU_LANE, PUBLISH_LANE or PAGE_PREFETCH_LANE.
+            fn (callable): The call, run in a copy of the caller's context.
+
+        Returns:
+            Future: The result of the call.
+        """
+        task = _Task(lane, fn, args, kwargs)
+        self._lane(lane).submit(task)
+        return task.future
+
+    def join(self, future, timeout=None):
+        """
+        Result of a future of this scheduler, running its task inline when it has not started and the caller is
+        a worker of the same lane, or the task is of an INLINE_JOIN_LANES lane.
+
+        Args:
+            future (Future): Returned by submit.
+            timeout (float): Seconds to wait for a task already running elsewhere.
+
+        Returns:
+            The result of the call, its exception is raised.
+        """
+        task = getattr(future, "scheduler_task", None)
+        if task is not None and (task.lane in INLINE_JOIN_LANES or getattr(_worker_lane, "name", None) == task.lane):
+            self._lane(task.lane).run_inline(task)
+        return future.result(timeout)
+
+    def stats(self):
+        """
+        Queue depth and activity of every lane started so far.
+
+        Returns:
+            dict: lane -> {"workers", "queued", "running", "completed", "inline", "peak_queued"}
+        """
+        return {name: lane.stats() for name, lane in list(self._lanes.items())}
+
+    def shutdown(self, wait=True):
+        """Stop every lane, the next submit starts them again."""
+        with self._lock:
+            lanes, self._lanes = self._lanes, {}
+        for lane in lanes.values():
+            lane.executor.shutdown(wait=wait)
+
+
+scheduler = Scheduler()
@@ -0,0 +1,237 @@
+"""
+Build-time bundle of the Travelport hotel schema.
+
+GDSHotels only uses hotel_vXX_0/Hotel.wsdl, but the uAPI tree ships every Travelport service. The build step
+resolves the import closure of the configured Hotel.wsdl and pickles the compiled zeep client with a manifest
+fingerprinting those files, so that Lambda init can skip the XML parsing entirely. The Dockerfile builds the
+bundle of both uAPI versions into GDS_SCHEMA_BUNDLE_DIR, which the image ships and sets for the runtime.
+
+Usage:
+    python -m app.services.hotelxmlconnector.hotel_vendor_request.schema_bundle build
+    python -m app.services.hotelxmlconnector.hotel_vendor_request.schema_bundle compare
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import traceback
+
+import zeep
+from lxml import etree
+from zeep import Client, Settings, Transport
+
+try:
+    from opensearchlogger.logging import logger
+except ImportError:  # The image build runs the bundle step without the Lambda layer
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+GDS_LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib", "gds")
+BUNDLE_DIR = os.getenv("GDS_SCHEMA_BUNDLE_DIR", os.path.join(GDS_LIB_DIR, "compiled"))
+BUNDLE_FORMAT_VERSION = 1
+CLIENT_FILE_NAME = "client.pickle"
+MANIFEST_FILE_NAME = "manifest.json"
+
+_REFERENCES = etree.XPath("//@schemaLocation | //*[local-name()='import']/@location")
+_TRANSPORT_PID = "transport"
+_SETTINGS_PID = "settings"
+_DICT_VIEW_TYPES = (type({}.values()), type(collections.OrderedDict().values()))
+
+
+def _make_dynamic_type(name, bases, attributes):
+    """Recreate one of the classes zeep generates per XSD type while parsing."""
+    return type(name, bases, attributes)
+
+
+def _is_dynamic_type(obj):
+    """Whether obj is a class generated at parse time, which pickle cannot import by name."""
+    module = sys.modules.get(obj.__module__)
+    return getattr(module, obj.__qualname__, None) is not obj
+
+
+class _BundlePickler(pickle.Pickler):
+    """Pickler leaving zeep transports (HTTP session) and settings (thread locals) out of the bundle."""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, etree.QName):
+            return etree.QName, (obj.text,)
+        if isinstance(obj, _DICT_VIEW_TYPES):
+            return list, (list(obj),)  # zeep only iterates over the attribute views it keeps
+        if isinstance(obj, type) and _is_dynamic_type(obj):
+            attributes = {key: value for key, value in vars(obj).items() if key not in ("__dict__", "__weakref__")}
+            return _make_dynamic_type, (obj.__name__, obj.__bases__, attributes)
+        return NotImplemented
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Transport):
+            return _TRANSPORT_PID
+        if isinstance(obj, Settings):
+            return _SETTINGS_PID
+        return None
+
+
+class _BundleUnpickler(pickle.Unpickler):
+    """Unpickler plugging the live transport and settings back in where the bundle left them out."""
+
+    def __init__(self, file, transport, settings):
+        super().__init__(file)
+        self._persistent = {_TRANSPORT_PID: transport, _SETTINGS_PID: settings}
+
+    def persistent_load(self, pid):
+        if pid not in self._persistent:
+            raise pickle.UnpicklingError(f"Unsupported persistent id in schema bundle: {pid}")
+        return self._persistent[pid]
+
+
+def hotel_wsdl_path(uapi_version, wsdl_version):
+    """Path of the source Hotel.wsdl for a TP_UAPI_VERSION / TP_UAPI_WSDL_VERSION pair."""
+    return os.path.join(GDS_LIB_DIR, uapi_version, "hotel_" + wsdl_version + "_0", "Hotel.wsdl")
+
+
+def bundle_path(wsdl_path):
+    """Directory of the bundle compiled from wsdl_path, e.g. compiled/uAPI_V18_hotel_v46_0."""
+    relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(wsdl_path)), GDS_LIB_DIR)
+    return os.path.join(BUNDLE_DIR, relative_dir.replace(os.sep, "_"))
+
+
+def resolve_import_closure(wsdl_path):
+    """
+    Resolve every WSDL/XSD file reachable from wsdl_path through import and include references.
+
+    Args:
+        wsdl_path (str): Path of the root WSDL.
+
+    Returns:
+        list: Sorted absolute paths of the reachable files, wsdl_path included.
+    """
+    pending = [os.path.abspath(wsdl_path)]
+    reachable = set()
+    while pending:
+        path = pending.pop()
+        if path in reachable:
+            continue
+        reachable.add(path)
+        for location in _REFERENCES(etree.parse(path)):
+            if "://" in location:
+                continue  # Remote imports are resolved by zeep at parse time, there is nothing to bundle.
+            pending.append(os.path.normpath(os.path.join(os.path.dirname(path), location)))
+    return sorted(reachable)
+
+
+def _fingerprint(files, settings):
+    """Hash of the schema sources and of everything the pickled client depends on."""
+    digest = hashlib.sha256()
+    digest.update(f"{BUNDLE_FORMAT_VERSION}|{zeep.__version__}|{sys.version_info[:2]}".encode())
+    digest.update(f"|{settings.strict}|{settings.xml_huge_tree}".encode())
+    for path in files:
+        digest.update(os.path.relpath(path, GDS_LIB_DIR).encode())
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def build_bundle(wsdl_path, settings=None):
+    """
+    Compile wsdl_path and write the pickled client and its manifest.
+
+    Args:
+        wsdl_path (str): Path of the source Hotel.wsdl.
+        settings: zeep settings used at runtime, defaults to the ones GDSHotels uses.
+
+    Returns:
+        dict: The manifest written next to the bundle.
+    """
+    settings = settings or Settings(strict=False, xml_huge_tree=True)
+    files = resolve_import_closure(wsdl_path)
+    output_dir = bundle_path(wsdl_path)
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    client = Client(os.path.abspath(wsdl_path), transport=Transport(), settings=settings)
+    with open(os.path.join(output_dir, CLIENT_FILE_NAME), "wb") as bundle:
+        _BundlePickler(bundle, protocol=pickle.HIGHEST_PROTOCOL).dump(client)
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "wsdl": os.path.relpath(os.path.abspath(wsdl_path), GDS_LIB_DIR),
+        "files": [os.path.relpath(path, GDS_LIB_DIR) for path in files],
+        "fingerprint": _fingerprint(files, settings),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def load_compiled_client(wsdl_path, settings=None, transport=None):
+    """
+    Load the bundled client compiled from wsdl_path.
+
+    Args:
+        wsdl_path (str): Path of the Hotel.wsdl the caller would otherwise parse.
+        settings: zeep settings the client must have been compiled with.
+        transport: Transport to attach to the loaded client.
+
+    Returns:
+        Client: The compiled client, or None when there is no bundle or it is stale.
+    """
+    settings = settings or Settings()
+    output_dir = bundle_path(wsdl_path)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        files = [os.path.join(GDS_LIB_DIR, path) for path in manifest["files"]]
+        if manifest["format_version"] != BUNDLE_FORMAT_VERSION or manifest["fingerprint"] != _fingerprint(files, settings):
+            logger.info(f"Schema bundle {output_dir} is stale, falling back to live WSDL parsing")
+            return None
+        with open(os.path.join(output_dir, CLIENT_FILE_NAME), "rb") as bundle:
+            return _BundleUnpickler(bundle, transport or Transport(), settings).load()
+    except Exception:
+        logger.error(f"Error while loading schema bundle {output_dir}: {traceback.format_exc()}")
+        return None
+
+
+def compare_load_paths(wsdl_path, settings=None, repeat=3):
+    """
+    Time the live WSDL parse against the bundle load.
+
+    Returns:
+        dict: Best of `repeat` runs for each load path, in seconds.
+    """
+    settings = settings or Settings(strict=False, xml_huge_tree=True)
+    timings = {"live_parse": [], "bundle_load": []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Client(os.path.abspath(wsdl_path), transport=Transport(), settings=settings)
+        timings["live_parse"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if load_compiled_client(wsdl_path, settings) is None:
+            raise RuntimeError(f"No usable schema bundle for {wsdl_path}, run the build command first")
+        timings["bundle_load"].append(time.perf_counter() - start)
+    return {name: round(min(values), 4) for name, values in timings.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark the precompiled uAPI hotel schema bundle")
+    parser.add_argument("command", choices=["build", "compare"])
+    parser.add_argument("--uapi-version", default=os.getenv("TP_UAPI_VERSION"))
+    parser.add_argument("--wsdl-version", default=os.getenv("TP_UAPI_WSDL_VERSION"))
+    args = parser.parse_args()
+
+    source_wsdl = hotel_wsdl_path(args.uapi_version, args.wsdl_version)
+    if args.command == "build":
+        built = build_bundle(source_wsdl)
+        print(f"Bundled {len(built['files'])} schema files into {bundle_path(source_wsdl)}")
+    else:
+        print(compare_load_paths(source_wsdl))
@@ -0,0 +1,92 @@
+from io import BytesIO
+
+from lxml import etree
+
+
+def clark_name(xpath, namespaces):
+    """
+    Clark notation tag of the last step of an xpath, e.g. y:HotelSearchResult -> {hotel namespace}HotelSearchResult
+    :param xpath: absolute xpath of the element, as in VENDOR_REQUEST_MAPPING
+    :param namespaces: prefix -> namespace mapping of the xpath
+    :return: tag usable to filter iterparse events
+    """
+    step = xpath.rsplit("/", 1)[-1]
+    if ":" not in step:
+        return step
+    prefix, local_name = step.split(":", 1)
+    return f"{{{namespaces[prefix]}}}{local_name}"
+
+
+class PageScan:
+    """
+    Single streaming pass over a search response.
+
+    results() yields every hotel result element as soon as it is parsed and clears it once the caller moved on,
+    so only one hotel is held in memory at a time instead of the whole page. Vendor errors and the next page
+    reference are collected during the same pass and are complete once results() is exhausted. Values read from
+    a result must be copied out as plain str, lxml smart strings reference their element and keep it alive.
+    """
+
+    def __init__(self, content, request_mapping):
+        namespaces = request_mapping["namespaces"]
+        self.content = content
+        self.result_tag = clark_name(request_mapping["result"], namespaces)
+        self.error_tag = clark_name(request_mapping["error"], namespaces)
+        self.next_page_reference_tag = (
+            clark_name(request_mapping["next_page_reference"], namespaces) if request_mapping["next_page_reference"] else None
+        )
+        self.errors = []
+        self.next_page_reference = None
+
+    def results(self):
+        tags = [tag for tag in (self.result_tag, self.error_tag, self.next_page_reference_tag) if tag]
+        for _, element in etree.iterparse(BytesIO(self.content), events=("end",), tag=tags, huge_tree=True):
+            if element.tag == self.result_tag:
+                yield element
+                element.clear(keep_tail=True)
+                # Drop the already processed siblings still referenced by the parent
+                parent = element.getparent()
+                while element.getprevious() is not None:
+                    del parent[0]
+            elif element.tag == self.error_tag:
+                self.errors.append(element)
+            else:
+                self.next_page_reference = element.text
+
+
+class ChunkScan:
+    """
+    Single streaming pass over a response whose items are published in chunks, e.g. the desiya RoomStays.
+
+    chunks() moves every item element into a chunk root as soon as it is parsed and yields the chunk once it holds
+    chunk_size items, as the serialised bytes and the chunk root together, so the chunk is neither re-parsed nor
+    pretty printed. The chunk root has the tag of the response root and the namespaces of the mapping, the
+    vendor's result xpath applies to it as to the whole response. Vendor errors and the item count are complete
+    once chunks() is exhausted.
+    """
+
+    def __init__(self, content, item_xpath, error_xpath, namespaces, chunk_size):
+        self.content = content
+        self.namespaces = namespaces
+        self.item_tag = clark_name(item_xpath, namespaces)
+        self.error_tag = clark_name(error_xpath, namespaces)
+        self.chunk_size = chunk_size
+        self.errors = []
+        self.item_count = 0
+
+    def chunks(self):
+        chunk_root = None
+        for _, element in etree.iterparse(BytesIO(self.content), events=("end",), tag=[self.item_tag, self.error_tag], huge_tree=True):
+            if element.tag == self.error_tag:
+                self.errors.append(element)
+                continue
+            if chunk_root is None:
+                chunk_root = etree.Element(element.getroottree().getroot().tag, nsmap=self.namespaces)
+            # Moving the item also drops it from the parsed response, which then never holds more than a chunk
+            chunk_root.append(element)
+            self.item_count += 1
+            if len(chunk_root) >= self.chunk_size:
+                yield etree.tostring(chunk_root), chunk_root
+                chunk_root = None
+        if chunk_root is not None:
+            yield etree.tostring(chunk_root), chunk_root
@@ -0,0 +1,80 @@
+import os
+import threading
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+# Connection pool per host, sized for the concurrent vendor calls (one per leased SOAPManager).
+HTTP_POOL_CONNECTIONS = int(os.getenv("VENDOR_HTTP_POOL_CONNECTIONS", 10))  # Hosts kept per session
+HTTP_POOL_MAXSIZE = int(os.getenv("VENDOR_HTTP_POOL_MAXSIZE", os.getenv("SOAP_POOL_MAX_SIZE", 40)))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("VENDOR_HTTP_CONNECT_TIMEOUT", 10))  # In sec
+HTTP_READ_TIMEOUT = float(os.getenv("VENDOR_HTTP_READ_TIMEOUT", 120))  # In sec
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+ACCEPT_ENCODING = "gzip, deflate"
+
+_vendor_sessions = {}
+_vendor_sessions_lock = threading.Lock()
+
+
+def build_session(headers=None):
+    """
+    Build a keep-alive session with a sized connection pool and compressed responses.
+
+    Args:
+        headers (dict): Headers sent with every request of the session, e.g. Authorization.
+
+    Returns:
+        Session: The configured session.
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # requests decodes gzip/deflate bodies transparently, response.content stays the plain XML.
+    session.headers.update({"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"})
+    session.headers.update(headers or {})
+    return session
+
+
+def get_session(key, headers=None):
+    """
+    Shared session for key, so every caller of the same vendor account reuses the same connections.
+
+    Args:
+        key (tuple): Identifies the vendor account, e.g. (service_url, username).
+        headers (dict): Headers of the session, only used when it is created.
+
+    Returns:
+        Session: The process-wide session of key.
+    """
+    session = _vendor_sessions.get(key)
+    if session is None:
+        with _vendor_sessions_lock:
+            session = _vendor_sessions.get(key)
+            if session is None:
+                session = build_session(headers)
+                _vendor_sessions[key] = session
+    return session
+
+
+def connection_stats():
+    """
+    Connection reuse per host across all shared sessions, since the start of the process.
+
+    Returns:
+        dict: host -> {"requests": sent, "connections": opened, "reused": requests served by an open connection}
+    """
+    stats = {}
+    for session in list(_vendor_sessions.values()):
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(f"{pool.host}:{pool.port}", {"requests": 0, "connections": 0})
+                host_stats["requests"] += pool.num_requests
+                host_stats["connections"] += pool.num_connections
+    for host_stats in stats.values():
+        host_stats["reused"] = max(host_stats["requests"] - host_stats["connections"], 0)
+    return stats
@@ -0,0 +1,5 @@
+import os
+
+# Read at import time by the connector modules, the tests pick their uAPI version explicitly
+os.environ.setdefault("TP_UAPI_VERSION", "uAPI_V22")
+os.environ.setdefault("TP_UAPI_WSDL_VERSION", "v52")
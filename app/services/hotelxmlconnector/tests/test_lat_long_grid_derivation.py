@@ -0,0 +1,37 @@
+"""
+The vectorised hexagonal grid must select exactly the points of the point by point geodesic version, including
+where the sphere and the ellipsoid disagree most (high latitudes) and where the longitudes wrap (antimeridian).
+"""
+import pytest
+
+from app.services.hotelxmlconnector.hotel_vendor_request.lat_long_grid_derivation import (
+    GRID_DIVISION_FACTOR,
+    _generate_hexagonal_grid_scalar,
+    generate_hexagonal_grid,
+)
+
+CASES = {
+    "las_vegas": (36.171563, -115.1391009, 30),
+    "bangalore": (12.9716, 77.5946, 50),
+    "equator_prime_meridian": (0.0, 0.0, 20),
+    "sydney": (-33.86882, 151.20929, 40),
+    "reykjavik": (64.1466, -21.9426, 10),
+    "tromso": (69.6492, 18.9553, 25),
+    "svalbard": (78.2232, 15.6267, 15),
+    "south_pole_station": (-80.0, 0.0, 12),
+    "antimeridian_east": (-16.5, 179.95, 30),
+    "antimeridian_west": (65.0, -179.9, 20),
+    "small_radius": (19.076, 72.8777, 2.5),
+}
+
+
+@pytest.mark.parametrize("lat, lng, radius", CASES.values(), ids=CASES.keys())
+@pytest.mark.parametrize("level", [0, 1, 2])
+def test_vectorised_grid_matches_scalar_grid(lat, lng, radius, level):
+    large_radius = radius / GRID_DIVISION_FACTOR**level
+    small_radius = large_radius / GRID_DIVISION_FACTOR
+
+    grid = generate_hexagonal_grid(lat, lng, large_radius, small_radius)
+
+    assert grid == _generate_hexagonal_grid_scalar(lat, lng, large_radius, small_radius)
+    assert grid
@@ -0,0 +1,105 @@
+"""
+The shared confluent_kafka producer and the KafkaConnector fallback must publish the same batch on the hotel
+details topic, so the consumers cannot tell which one published it.
+"""
+import json
+from collections import OrderedDict
+
+import pytest
+
+from app.services.hotelxmlconnector.hotel_vendor_request import message_format, producer
+
+
+class RecordingProducer:
+    """confluent_kafka.Producer keeping what it was asked to send."""
+
+    sent = []
+
+    def __init__(self, config):
+        self.config = config
+
+    def produce(self, topic, value, key, on_delivery):
+        self.sent.append((topic, key, value))
+
+    def poll(self, timeout):
+        return 0
+
+
+class RecordingKafkaConnector:
+    """KafkaConnector of the helper layer, keeping the messages it was given to encode."""
+
+    sent = []
+
+    def produce(self, messages, is_parallel_push=False):
+        self.sent.append(messages)
+
+
+def _messages(batch_data):
+    return {"batch_data": batch_data, "kafka_topic": "hotel-details", "kafka_key": "leg-42" + str(7)}
+
+
+BATCH = {
+    "request_payload": {"leg_req_info": {"hotel_request": {"leg_request_id": "leg-42"}}, "radius": 2.5},
+    "hotel_data": [
+        {"hotel_id": "H1", "hotel_chain": "MC", "membership_deal_mapping": {"deal": "Bonvoy ünïcode"}},
+        {"hotel_id": "H2", "hotel_chain": None},
+    ],
+    "batch_num": 3,
+    "s3_metadata": {"bucket": "hotels", "key": "2026_10_18/leg-42/1.xml", "hotel_index": "2026_10_18/leg-42/1.idx.json"},
+    "total_batches": 3,
+    "published_at": "2026-10-18 09:30:00",
+}
+
+
+@pytest.fixture
+def stored_objects(monkeypatch):
+    objects = {}
+    monkeypatch.setattr(message_format, "_stored_references", OrderedDict())
+    monkeypatch.setattr(message_format, "save_to_s3", lambda bucket, key, content: objects.update({key: content}))
+    monkeypatch.setenv("HOTEL_S3_BUCKET_NAME", "hotels")
+    return objects
+
+
+@pytest.fixture
+def recorded(monkeypatch, stored_objects):
+    RecordingProducer.sent, RecordingKafkaConnector.sent = [], []
+    monkeypatch.setattr(producer, "Producer", RecordingProducer)
+    monkeypatch.setattr(producer, "KafkaConnector", RecordingKafkaConnector)
+    monkeypatch.setenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+    return RecordingProducer.sent, RecordingKafkaConnector.sent
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_shared_and_connector_producers_publish_the_same_batch(monkeypatch, recorded, stored_objects, version):
+    shared_sent, connector_sent = recorded
+    batch = message_format.build_batch(BATCH, version)
+
+    monkeypatch.setattr(producer, "KAFKA_PRODUCER_MODE", "shared")
+    shared = producer.HotelDetailsProducer()
+    shared_bytes = shared.produce(_messages(batch), producer.DeliveryTracker())
+
+    monkeypatch.setattr(producer, "KAFKA_PRODUCER_MODE", "connector")
+    connector = producer.HotelDetailsProducer()
+    connector_bytes = connector.produce(_messages(batch), producer.DeliveryTracker())
+
+    def fetch(reference):
+        return json.loads(stored_objects[reference[len("s3://hotels/") :]])
+
+    assert shared.producer is not None and connector.producer is None
+    assert len(shared_sent) == len(connector_sent) == 1
+    topic, key, value = shared_sent[0]
+    assert (topic, key) == (connector_sent[0]["kafka_topic"], str(connector_sent[0]["kafka_key"]).encode("utf-8"))
+    assert connector_sent[0]["batch_data"] == json.loads(value)
+    assert message_format.decode_batch(connector_sent[0]["batch_data"], fetch) == message_format.decode_batch(value, fetch)
+    assert message_format.decode_batch(value, fetch) == BATCH
+    assert shared_bytes == connector_bytes == len(value)
+
+
+def test_shared_mode_without_bootstrap_servers_logs_the_fallback(monkeypatch, recorded):
+    errors = []
+    monkeypatch.delenv("KAFKA_BOOTSTRAP_SERVERS")
+    monkeypatch.setattr(producer, "KAFKA_PRODUCER_MODE", "shared")
+    monkeypatch.setattr(producer.logger, "error", errors.append)
+
+    assert producer.HotelDetailsProducer().producer is None
+    assert len(errors) == 1 and "KAFKA_BOOTSTRAP_SERVERS" in errors[0]
@@ -0,0 +1,53 @@
+"""
+Only overload shrinks the limits of an endpoint: the SOAP faults uAPI answers empty cells with (HTTP 500) are
+vendor answers and must not throttle every other leg of the process.
+"""
+from app.services.hotelxmlconnector.hotel_vendor_request import rate_limit
+
+
+def _limiter():
+    return rate_limit.EndpointLimiter("https://uapi.example/HotelService", rate=20, burst=20, concurrency=16)
+
+
+def _call(limiter, status_code):
+    with limiter.slot() as vendor_call:
+        vendor_call.record(status_code)
+
+
+def test_soap_faults_leave_the_limits_unchanged():
+    limiter = _limiter()
+
+    for _ in range(15):
+        _call(limiter, 500)
+
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 16
+    assert stats["rate_limit"] == 20
+    assert stats["fault_rate"] == 0
+    assert stats["decreases"] == 0
+    assert stats["calls"] == 15
+
+
+def test_overload_statuses_halve_the_limits_once_per_cooldown():
+    limiter = _limiter()
+
+    for status_code in rate_limit.OVERLOAD_STATUS_CODES:
+        _call(limiter, status_code)
+
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 16 * rate_limit.VENDOR_DECREASE_FACTOR
+    assert stats["rate_limit"] == 20 * rate_limit.VENDOR_DECREASE_FACTOR
+    assert stats["decreases"] == 1
+    assert stats["faults"] == len(rate_limit.OVERLOAD_STATUS_CODES)
+
+
+def test_transport_failures_count_as_overload():
+    limiter = _limiter()
+
+    try:
+        with limiter.slot():
+            raise ConnectionError("reset by peer")
+    except ConnectionError:
+        pass
+
+    assert limiter.stats()["decreases"] == 1
@@ -0,0 +1,70 @@
+"""
+The template builder must post the same bytes as zeep. Both are fed through the production path of GDSHotels:
+_render_template for the template, _request_handler (pydantic) then zeep for the reference.
+"""
+from types import SimpleNamespace
+
+import pytest
+from zeep import Client, Settings
+from zeep.wsdl.utils import etree_to_string
+
+from app.services.hotelxmlconnector.hotel_vendor_request import schema_bundle
+from app.services.hotelxmlconnector.hotel_vendor_request.vendor import gds
+
+UAPI_VERSIONS = [("uAPI_V18", "v46"), ("uAPI_V22", "v52")]
+
+BASE_SEARCH = {
+    "latitude": "12.97159",
+    "longitude": "77.59456",
+    "radius": 5,
+    "check_in_date": "2025-03-31",
+    "checkout_date": "2025-04-01",
+    "no_of_adults": 1,
+    "no_of_rooms": 1,
+    "currency": "INR",
+}
+
+CASES = {
+    "first_page": ({}, None, None),
+    "negative_coordinates": ({"latitude": -33.86882, "longitude": -151.20929, "currency": "USD"}, None, None),
+    "whole_coordinates": ({"latitude": 40, "longitude": -74, "radius": 12.0}, None, None),
+    "permitted_chains": ({"no_of_adults": 2, "no_of_rooms": 2}, ["MC", "RC", "AR"], None),
+    "next_page": ({}, None, "H4sIAAAAAAAA/+1Y&W2<8>\"x'"),
+    "next_page_with_chains": ({}, ["MC"], "ABC123=="),
+}
+
+_clients = {}
+
+
+def _zeep_request(uapi_version, wsdl_version, params):
+    if uapi_version not in _clients:
+        client = Client(schema_bundle.hotel_wsdl_path(uapi_version, wsdl_version), settings=Settings(strict=False, xml_huge_tree=True))
+        service = client.create_service(
+            "{http://www.travelport.com/service/hotel_" + wsdl_version + "_0}HotelSearchServiceBinding", "http://localhost"
+        )
+        _clients[uapi_version] = (client, service)
+    client, service = _clients[uapi_version]
+    return etree_to_string(client.create_message(service, "service", **params))
+
+
+def _gds_hotels(permitted_chains):
+    # The SOAP pool is not needed to build requests
+    hotels = gds.GDSHotels.__new__(gds.GDSHotels)
+    hotels.fre_config = SimpleNamespace(token_member_id="P7141733")
+    hotels.allowed_allied_marriott_chains = permitted_chains
+    return hotels
+
+
+@pytest.mark.parametrize("uapi_version,wsdl_version", UAPI_VERSIONS)
+@pytest.mark.parametrize("case", list(CASES))
+def test_template_is_byte_identical_to_zeep(monkeypatch, uapi_version, wsdl_version, case):
+    overrides, permitted_chains, next_page_reference = CASES[case]
+    monkeypatch.setattr(gds, "TP_UAPI_WSDL_VERSION", wsdl_version)
+    hotel_search = SimpleNamespace(**{**BASE_SEARCH, **overrides})
+    hotels = _gds_hotels(permitted_chains)
+
+    params = hotels._request_handler(hotel_search)
+    if next_page_reference:
+        params["NextResultReference"] = {"ProviderCode": "1G", "_value_1": next_page_reference}
+
+    assert hotels._render_template(hotel_search, next_page_reference) == _zeep_request(uapi_version, wsdl_version, params)
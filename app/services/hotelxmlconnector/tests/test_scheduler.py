@@ -0,0 +1,69 @@
+"""
+The next page request must overlap with the processing of the current page even when every vendor IO worker is
+held by a page loop, as under production load.
+"""
+import time
+
+from app.services.hotelxmlconnector.hotel_vendor_request.scheduler import (
+    CPU_LANE,
+    PAGE_PREFETCH_LANE,
+    PUBLISH_LANE,
+    VENDOR_IO_LANE,
+    Scheduler,
+)
+
+PAGES = 4
+FETCH_SECONDS = 0.1
+PROCESS_SECONDS = 0.1
+
+
+def _page_loop(scheduler, prefetch_lane):
+    page = scheduler.join(scheduler.submit(prefetch_lane, time.sleep, FETCH_SECONDS))
+    for _ in range(PAGES - 1):
+        next_page = scheduler.submit(prefetch_lane, time.sleep, FETCH_SECONDS)
+        time.sleep(PROCESS_SECONDS)
+        page = scheduler.join(next_page)
+    return page
+
+
+def _run_saturated(prefetch_lane):
+    scheduler = Scheduler(thread_budget=16, lane_workers={VENDOR_IO_LANE: 2, CPU_LANE: 1, PUBLISH_LANE: 1, PAGE_PREFETCH_LANE: 2})
+    try:
+        start = time.perf_counter()
+        # As many page loops as vendor IO workers, the lane has no worker left for a prefetch
+        loops = [scheduler.submit(VENDOR_IO_LANE, _page_loop, scheduler, prefetch_lane) for _ in range(2)]
+        for loop in loops:
+            loop.result()
+        return time.perf_counter() - start, scheduler.stats()
+    finally:
+        scheduler.shutdown()
+
+
+def test_prefetch_lane_overlaps_with_processing_under_a_saturated_vendor_io_lane():
+    elapsed, stats = _run_saturated(PAGE_PREFETCH_LANE)
+
+    sequential = PAGES * FETCH_SECONDS + (PAGES - 1) * PROCESS_SECONDS
+    overlapped = FETCH_SECONDS + (PAGES - 1) * max(FETCH_SECONDS, PROCESS_SECONDS)
+    assert elapsed < (sequential + overlapped) / 2
+    assert stats[PAGE_PREFETCH_LANE]["completed"] == 2 * PAGES
+
+
+def test_prefetch_on_the_vendor_io_lane_runs_inline_when_saturated():
+    elapsed, stats = _run_saturated(VENDOR_IO_LANE)
+
+    assert elapsed >= PAGES * FETCH_SECONDS + (PAGES - 1) * PROCESS_SECONDS
+    assert stats[VENDOR_IO_LANE]["inline"] == 2 * PAGES
+
+
+def test_queued_prefetch_runs_inline_on_join():
+    scheduler = Scheduler(thread_budget=16, lane_workers={VENDOR_IO_LANE: 1, CPU_LANE: 1, PUBLISH_LANE: 1, PAGE_PREFETCH_LANE: 1})
+    try:
+        blocker = scheduler.submit(PAGE_PREFETCH_LANE, time.sleep, 0.3)
+        queued = scheduler.submit(PAGE_PREFETCH_LANE, lambda: "page")
+        start = time.perf_counter()
+        assert scheduler.join(queued) == "page"
+        assert time.perf_counter() - start < 0.2
+        assert scheduler.stats()[PAGE_PREFETCH_LANE]["inline"] == 1
+        blocker.result()
+    finally:
+        scheduler.shutdown()
@@ -0,0 +1,98 @@
+import asyncio
+import os
+from typing import AsyncIterator, Callable, List, Optional
+
+from opensearchlogger.logging import logger
+
+from app.services.hotelrequesthub import app as hotelrequesthub
+from app.services.hotelxmlconnector import app as hotelxmlconnector
+from app.utils.format_response import format_requesthub_payload
+
+MAX_CONCURRENT_CONNECTORS = int(os.getenv("MAX_CONCURRENT_CONNECTORS", 8))
+_STREAM_END = object()
+
+
+async def run_requesthub(event: dict) -> dict:
+    """
+    Run the blocking request hub handler on a worker thread so the event loop stays free
+    :param event: request hub event (trip_info and hotel_request)
+    :return: raw request hub response
+    """
+    return await asyncio.to_thread(hotelrequesthub.handler, event, None)
+
+
+def _run_xml_connector(connector_request: dict, progress_listener: Optional[Callable]):
+    """Run one xml connector, routing its progress records to progress_listener."""
+    hotelxmlconnector.progress_listener.set(progress_listener)
+    return hotelxmlconnector.handler(connector_request, None)
+
+
+async def dispatch_xml_connectors(
+    connector_requests: List[dict],
+    max_concurrency: int = MAX_CONCURRENT_CONNECTORS,
+    progress_listener: Optional[Callable] = None,
+) -> list:
+    """
+    Run every xml connector concurrently, at most max_concurrency at a time
+    :param connector_requests: formatted connector payloads from format_requesthub_payload
+    :param max_concurrency: maximum number of connectors running at the same time
+    :param progress_listener: optional callable receiving connector progress records, called from worker threads
+    :return: connector results in the order of the xml connector requests
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _dispatch(connector_request: dict):
+        async with semaphore:
+            return await asyncio.to_thread(_run_xml_connector, connector_request, progress_listener)
+
+    xml_requests = [request for request in connector_requests if request.get("fre_config", {}).get("response_type") == "xml"]
+    results = await asyncio.gather(*(_dispatch(request) for request in xml_requests), return_exceptions=True)
+
+    for request, result in zip(xml_requests, results):
+        if isinstance(result, BaseException):
+            logger.error(f"xml connector {request['fre_config'].get('name')} failed: {result!r}")
+    return results
+
+
+async def stream_hotelrequesthub(event: dict, max_concurrency: int = MAX_CONCURRENT_CONNECTORS) -> AsyncIterator[dict]:
+    """
+    Run the request hub and the xml connectors, yielding progress records as soon as each one completes
+    :param event: request hub event (trip_info and hotel_request)
+    :param max_concurrency: maximum number of connectors running at the same time
+    :return: async iterator of progress records, each with a "type" of requesthub, location, connector, error or done
+    """
+    connector_requests = await run_requesthub(event)
+    if not connector_requests:
+        yield {"type": "error", "detail": "Hotel request hub failure"}
+        return
+
+    connector_requests = format_requesthub_payload(connector_requests)
+    yield {
+        "type": "requesthub",
+        "connectors": [request["fre_config"].get("name") for request in connector_requests],
+    }
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def _listener(record: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, record)
+
+    dispatch = asyncio.ensure_future(dispatch_xml_connectors(connector_requests, max_concurrency, _listener))
+    # Records from worker threads are queued before their connector finishes, so the end marker always comes last.
+    dispatch.add_done_callback(lambda _: queue.put_nowait(_STREAM_END))
+
+    try:
+        while True:
+            record = await queue.get()
+            if record is _STREAM_END:
+                break
+            yield record
+    finally:
+        if not dispatch.done():
+            dispatch.cancel()
+
+    for result in dispatch.result():
+        if isinstance(result, BaseException):
+            yield {"type": "error", "detail": repr(result)}
+    yield {"type": "done"}